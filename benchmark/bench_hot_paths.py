@@ -0,0 +1,252 @@
+""" Benchmark of the hot paths of mlogger: update of each metric type, log,
+save_to / load_container for each format, and plot_on replay. Runs offline,
+with a stub visdom that discards the requests.
+
+For each benchmark, reports the time per operation (minimum over repeats)
+and the peak memory allocated during one run (with tracemalloc). The time
+per call of log is also reported with the history stored in Python lists
+(case 'baseline (list history)'), to compare with the float64 buffers:
+
+    python benchmark/bench_hot_paths.py [--quick] [--output results.json]
+
+Results are written as JSON with --output, and can be compared with the
+results of another version:
+
+    python benchmark/bench_hot_paths.py --compare results_before.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+import tracemalloc
+import numpy as np
+
+import mlogger
+from mlogger.plotter import visdom_plotter
+
+
+class StubVisdom(object):
+    """ Accepts the requests of VisdomPlotter without sending them.
+    """
+    def __init__(self, **kwargs):
+        pass
+
+    def line(self, Y, X=None, opts=None, win=None, name=None, update=None):
+        return win if win is not None else 'window'
+
+    def text(self, text, win=None, append=False):
+        return win if win is not None else 'text_window'
+
+
+class StubVisdomModule(object):
+    Visdom = StubVisdom
+
+
+def metrics():
+    yield 'Simple', lambda: mlogger.metric.Simple(), (0.5,)
+    yield 'Average', lambda: mlogger.metric.Average(), (0.5,)
+    yield 'Sum', lambda: mlogger.metric.Sum(), (0.5,)
+    yield 'Maximum', lambda: mlogger.metric.Maximum(), (0.5,)
+    yield 'Minimum', lambda: mlogger.metric.Minimum(), (0.5,)
+    yield 'Timer', lambda: mlogger.metric.Timer(), ()
+    yield 'EMA', lambda: mlogger.metric.EMA(0.9), (0.5,)
+    yield 'WindowedAverage', lambda: mlogger.metric.WindowedAverage(100), (0.5,)
+    yield 'Histogram', lambda: mlogger.metric.Histogram(100, 0, 1), (0.5,)
+    yield 'Quantile', lambda: mlogger.metric.Quantile(), (0.5,)
+
+
+def measure(setup, run, number, repeat):
+    """ Seconds per operation of run(state) (which makes number operations),
+    minimum over repeat runs, and peak memory in bytes of one run.
+    """
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        times.append(timeit.timeit(lambda: run(state), number=1) / number)
+
+    state = setup()
+    tracemalloc.start()
+    try:
+        run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), peak
+
+
+def bench_update(n_updates, repeat):
+    for name, make, args in metrics():
+        def run(metric, args=args):
+            update = metric.update
+            for _ in range(n_updates):
+                update(*args)
+        yield 'update', {'metric': name}, measure(make, run, n_updates, repeat)
+
+
+class ListHistory(object):
+    """ History stored in Python lists, as before the float64 buffers: the
+    baseline of the per-call time of log.
+    """
+    def __init__(self):
+        self.time_indexing = False
+        self._times = []
+        self._values = []
+
+    def time(self, now=None):
+        return self._times[-1] + 1 if self._times else 0
+
+    def log(self, event_time, value):
+        self._times.append(event_time)
+        self._values.append(value)
+        return self
+
+
+def with_list_history(metric):
+    metric._history = ListHistory()
+    return metric
+
+
+def bench_log(n_logs, repeat):
+    def make_plotter(**kwargs):
+        return mlogger.VisdomPlotter({}, **kwargs)
+
+    cases = [
+        ('baseline (list history)', lambda: with_list_history(mlogger.metric.Simple())),
+        ('no plotter', lambda: mlogger.metric.Simple()),
+        ('plotter', lambda: mlogger.metric.Simple(plotter=make_plotter(), plot_title='title')),
+        ('plotter, manual update',
+         lambda: mlogger.metric.Simple(plotter=make_plotter(manual_update=True), plot_title='title')),
+        ('retention', lambda: mlogger.metric.Simple().set_retention(mlogger.Retention(raw=1000))),
+    ]
+    for name, make in cases:
+        def setup(make=make):
+            return make().update(0.5)
+
+        def run(metric):
+            log = metric.log
+            for _ in range(n_logs):
+                log()
+        yield 'log', {'case': name}, measure(setup, run, n_logs, repeat)
+
+
+def make_container(n_metrics, n_points):
+    xp = mlogger.Container()
+    xp.config = mlogger.Config(get_general_info=False, lr=0.1)
+    state = {'times': np.arange(n_points, dtype=np.float64).tolist(),
+             'values': np.random.rand(n_points).tolist(),
+             'start_time': 0, 'time_indexing': False}
+    for i in range(n_metrics):
+        metric = mlogger.metric.Average()
+        metric._history.load_state_dict(dict(state))
+        setattr(xp, 'metric_{}'.format(i), metric)
+    return xp
+
+
+def bench_save_load(sizes, repeat, directory):
+    for n_metrics, n_points in sizes:
+        for format, extension in (('json', '.json'), ('npz', '.npz'), ('journal', '.jsonl')):
+            filename = os.path.join(directory, 'xp' + extension)
+            params = {'format': format, 'n_metrics': n_metrics, 'n_points': n_points}
+
+            def setup_save(n_metrics=n_metrics, n_points=n_points):
+                if os.path.exists(filename):
+                    os.remove(filename)
+                return make_container(n_metrics, n_points)
+
+            def run_save(xp, filename=filename):
+                xp.save_to(filename)
+            yield 'save_to', params, measure(setup_save, run_save, 1, repeat)
+
+            def run_load(_, filename=filename):
+                mlogger.load_container(filename)
+            yield 'load_container', params, measure(lambda: None, run_load, 1, repeat)
+
+            if format == 'npz':
+                def run_lazy_load(_, filename=filename):
+                    mlogger.load_container(filename, lazy=True)
+                yield 'load_container', dict(params, lazy=True), measure(lambda: None, run_lazy_load, 1, repeat)
+
+
+def bench_plot_on(lengths, repeat):
+    for n_points in lengths:
+        for max_points in (None, 1000):
+            def setup(n_points=n_points, max_points=max_points):
+                plotter = mlogger.VisdomPlotter({}, manual_update=True, max_points=max_points)
+                return plotter, make_container(1, n_points).metric_0
+
+            def run(state):
+                plotter, metric = state
+                metric.plot_on(plotter, 'title')
+                plotter.update_plots()
+            params = {'n_points': n_points, 'max_points': max_points}
+            yield 'plot_on', params, measure(setup, run, 1, repeat)
+
+
+def run_all(quick=False):
+    if quick:
+        n_ops, repeat = 10000, 3
+        sizes = [(1, 1000), (10, 10000)]
+        lengths = [10000]
+    else:
+        n_ops, repeat = 100000, 5
+        sizes = [(1, 1000), (1, 100000), (10, 10000), (100, 1000), (10, 100000)]
+        lengths = [10000, 1000000]
+
+    directory = tempfile.mkdtemp()
+    try:
+        benchmarks = [bench_update(n_ops, repeat), bench_log(n_ops, repeat),
+                      bench_save_load(sizes, repeat, directory), bench_plot_on(lengths, repeat)]
+        for benchmark in benchmarks:
+            for name, params, (seconds, peak) in benchmark:
+                result = {'name': name, 'params': params, 'ns_per_op': 1e9 * seconds, 'peak_bytes': peak}
+                print_result(result)
+                yield result
+    finally:
+        shutil.rmtree(directory)
+
+
+def key(result):
+    return result['name'], json.dumps(result['params'], sort_keys=True)
+
+
+def print_result(result, before=None):
+    params = ', '.join('{}={}'.format(k, v) for k, v in sorted(result['params'].items()))
+    line = "{:<16} {:<55} {:>14.1f} ns {:>10.1f} KiB".format(
+        result['name'], params, result['ns_per_op'], result['peak_bytes'] / 1024.)
+    if before is not None:
+        line += " {:>7.2f}x".format(result['ns_per_op'] / before['ns_per_op'])
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quick', action='store_true', help="smaller sizes, for a quick check")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="JSON file of previous results to compare with (ratio of times)")
+    args = parser.parse_args()
+
+    visdom_plotter.visdom = StubVisdomModule
+
+    results = list(run_all(args.quick))
+
+    if args.compare:
+        with open(args.compare) as f:
+            before = dict((key(result), result) for result in json.load(f)['results'])
+        print("\nCompared with {} (time ratio, > 1 is slower):".format(args.compare))
+        for result in results:
+            if key(result) in before:
+                print_result(result, before[key(result)])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'numpy': np.__version__,
+                       'platform': platform.platform(), 'quick': args.quick,
+                       'results': results}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
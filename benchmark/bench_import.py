@@ -0,0 +1,53 @@
+""" Benchmark of the time taken by `import mlogger` in a fresh interpreter,
+compared with the import of numpy alone (the only dependency imported
+eagerly). Also checks that the optional or slow dependencies (pytorch,
+GitPython, pkg_resources, visdom) are not imported:
+
+    python benchmark/bench_import.py [--repeat 20] [--output results.json]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import timeit
+
+# dependencies that must only be imported when the feature using them is used
+LAZY_MODULES = ('torch', 'git', 'pkg_resources', 'visdom')
+
+CHECK = ("import sys, json, mlogger; "
+         "print(json.dumps([m for m in {} if m in sys.modules]))").format(list(LAZY_MODULES))
+
+
+def import_time(statement, repeat):
+    # median wall time of a fresh interpreter running statement
+    command = [sys.executable, '-c', statement]
+    times = sorted(timeit.timeit(lambda: subprocess.check_call(command), number=1) for _ in range(repeat))
+    return times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    eager = json.loads(subprocess.check_output([sys.executable, '-c', CHECK]).decode())
+    baseline = import_time('import numpy', args.repeat)
+    total = import_time('import mlogger', args.repeat)
+
+    print("interpreter + numpy:   {:8.1f} ms".format(1e3 * baseline))
+    print("interpreter + mlogger: {:8.1f} ms".format(1e3 * total))
+    print("mlogger alone:         {:8.1f} ms".format(1e3 * (total - baseline)))
+    print("lazy modules imported: {}".format(', '.join(eager) if eager else 'none'))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'numpy_ms': 1e3 * baseline,
+                       'mlogger_ms': 1e3 * total, 'eager_lazy_modules': eager}, f, indent=1)
+
+    if eager:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
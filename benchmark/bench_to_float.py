@@ -0,0 +1,63 @@
+""" Micro-benchmark of mlogger.metric.to_float, which is called on every
+update of every metric.
+
+Compares the current implementation with the previous one (sequence of
+isinstance checks), for the types of values usually passed to update:
+
+    python benchmark/bench_to_float.py
+"""
+import timeit
+import numpy as np
+
+from mlogger.metric.to_float import to_float
+
+try:
+    import torch
+    import torch.autograd as torch_autograd
+except ImportError:
+    torch = None
+    torch_autograd = None
+
+
+def to_float_reference(val):
+    # implementation before the per-type dispatch table
+    n_elements = 1
+    if isinstance(val, np.ndarray):
+        n_elements = val.size
+    elif torch is not None and (isinstance(val, torch_autograd.Variable) or torch.is_tensor(val)):
+        n_elements = torch.numel(val)
+
+    assert n_elements == 1, \
+        "val should have one element (got {})".format(n_elements)
+    try:
+        return float(val)
+    except:
+        raise TypeError("Unsupported type for val ({})".format(type(val)))
+
+
+def values():
+    yield "float", 0.5
+    yield "int", 3
+    yield "numpy.float32", np.float32(0.5)
+    yield "numpy.float64", np.float64(0.5)
+    yield "numpy 0-d array", np.array(0.5)
+    if torch is not None:
+        yield "torch 0-d tensor", torch.tensor(0.5)
+
+
+def ns_per_call(fn, val, number):
+    timer = timeit.Timer(lambda: fn(val))
+    return 1e9 * min(timer.repeat(repeat=5, number=number)) / number
+
+
+def main(number=100000):
+    print("{:<20} {:>15} {:>15} {:>10}".format("type", "before (ns)", "after (ns)", "speedup"))
+    for name, val in values():
+        assert to_float(val) == to_float_reference(val)
+        before = ns_per_call(to_float_reference, val, number)
+        after = ns_per_call(to_float, val, number)
+        print("{:<20} {:>15.1f} {:>15.1f} {:>9.1f}x".format(name, before, after, before / after))
+
+
+if __name__ == "__main__":
+    main()
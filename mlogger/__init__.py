@@ -3,4 +3,8 @@ from .plotter import VisdomPlotter
 from .stdout import stdout_to
 from .metric import *
 from .container import Container, load_container
-from .defaults import use_time_indexing
+from .metric.history import Retention
+from .defaults import use_time_indexing, use_retention
+from .index import Index, build_index
+from .registry import register
+from . import distributed, profiler
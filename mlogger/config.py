@@ -1,17 +1,37 @@
-import pkg_resources
+import gzip
+import hashlib
 import os
 import socket
-import git
+import threading
 import time
 import sys
+import warnings
 import mlogger
 
+from . import registry
+from .serialization import _replace
 
+# git information per (repository, commit, options), collected once per process
+_git_cache = {}
+_git_cache_lock = threading.Lock()
+
+
+@registry.register
 class Config(object):
-    def __init__(self, plotter=None, plot_title=None,
-                 get_general_info=True, get_git_info=False, **kwargs):
+    def __init__(self, plotter=None, plot_title=None, get_general_info=True, get_git_info=False,
+                 git_background=False, git_diff_dir=None, git_max_diff_size=None, **kwargs):
+        """ Key-value store for the configuration of an experiment. Other
+        keyword arguments are stored as fields.
+        * get_general_info:
+            store the date, command line, pid, working directory and hostname
+        * get_git_info:
+            store the git hash and diff, with update_git_info(git_background,
+            git_diff_dir, git_max_diff_size)
+        """
 
         object.__setattr__(self, '_state', {})
+        # thread collecting git information in the background
+        object.__setattr__(self, '_git_pending', None)
 
         if plotter is not None:
             self.plot_on(plotter, plot_title)
@@ -23,33 +43,87 @@ class Config(object):
             self.update_general_info()
 
         if get_git_info:
-            self.update_git_info()
+            self.update_git_info(git_background, git_diff_dir, git_max_diff_size)
 
         self.update(**kwargs)
 
     def update_general_info(self):
         self.update(
             date_and_time=time.strftime('%d-%m-%Y--%H-%M-%S'),
-            mlogger_version=pkg_resources.get_distribution("mlogger").version,
+            mlogger_version=_mlogger_version(),
             command_line=' '.join(sys.argv),
             pid=os.getpid(),
             cwd=os.getcwd(),
             hostname=socket.gethostname())
 
-    def update_git_info(self):
-        try:
-            repo = git.Repo(search_parent_directories=True)
-            head = repo.head.commit.tree
-            self.update(git_hash=repo.head.object.hexsha,
-                        git_diff=repo.git.diff(head))
-        except:
-            print("I tried to find a git repository in current "
-                  "and parent directories but did not find any.")
+    def update_git_info(self, background=False, diff_dir=None, max_diff_size=None):
+        """ Store the hash of the current commit (git_hash) and the diff of the
+        working tree (git_diff). The diff is computed once per process and commit.
+        * background:
+            if True, the information is collected in a background thread, and
+            added to the config (and sent to its plotter) when the thread
+            finishes. Reading a git_* field waits for it (see also
+            wait_git_info)
+        * diff_dir:
+            if not None, the diff is written once to a gzip file of diff_dir
+            named after its content, and the path of the file is stored
+            (git_diff_file) instead of the diff (see read_git_diff)
+        * max_diff_size:
+            if not None, the diff is truncated to max_diff_size characters
+            (git_diff_truncated is True if it has been)
+        """
+        if not background:
+            info = _git_info(diff_dir, max_diff_size)
+            if info is not None:
+                self.update(**info)
+            return self
+
+        def collect():
+            info = _git_info(diff_dir, max_diff_size)
+            if info is not None:
+                self.update(**info)
+
+        thread = threading.Thread(target=collect)
+        thread.daemon = True
+        object.__setattr__(self, '_git_pending', thread)
+        thread.start()
+        return self
+
+    def wait_git_info(self, timeout=None):
+        """ Wait for the git information collected in the background (see
+        update_git_info). Returns False if it is not in the config after
+        timeout seconds.
+        """
+        thread = self._git_pending
+        if thread is None:
+            return True
+        thread.join(timeout)
+        if thread.is_alive():
+            return False
+        object.__setattr__(self, '_git_pending', None)
+        return True
+
+    def read_git_diff(self):
+        """ Diff of the working tree stored by update_git_info, read from its
+        side file if needed (None if there is none).
+        """
+        self.wait_git_info()
+        if 'git_diff' in self._state:
+            return self._state['git_diff']
+        if 'git_diff_file' in self._state:
+            with gzip.open(self._state['git_diff_file'], 'rb') as f:
+                return f.read().decode('utf-8')
+        return None
 
     def state_dict(self):
         state = {}
         state['repr'] = repr(self)
-        state['_state'] = self._state
+        if registry.name_of(type(self)) is not None:
+            state['__type__'] = registry.name_of(type(self))
+            # the general information is restored by load_state_dict
+            state['__args__'] = {'get_general_info': False}
+        # copy: git information collected in the background may be added meanwhile
+        state['_state'] = dict(self._state)
         state['plot_title'] = self._plot_title
         return state
 
@@ -83,9 +157,81 @@ class Config(object):
         if key == '_state':
             return object.__getattr__(self, _state)
         else:
+            if key.startswith('git_') and key not in self._state and self.__dict__.get('_git_pending'):
+                self.wait_git_info()
             return self._state[key]
 
     def __setattr__(self, key, value):
         if key == '_state':
             raise TypeError("attribute '_state' of Config() does not support assignment")
         self._state[key] = value
+
+
+def _mlogger_version():
+    # imported on first use: pkg_resources is slow to import
+    try:
+        from importlib.metadata import version
+    except ImportError:
+        from pkg_resources import get_distribution
+        return get_distribution("mlogger").version
+    return version("mlogger")
+
+
+def _git_info(diff_dir, max_diff_size):
+    # imported on first use: GitPython is slow to import
+    import git
+
+    # the side file stays readable after a change of working directory
+    if diff_dir is not None:
+        diff_dir = os.path.abspath(diff_dir)
+
+    try:
+        repo = git.Repo(search_parent_directories=True)
+        git_hash = repo.head.object.hexsha
+    except (git.InvalidGitRepositoryError, git.NoSuchPathError, ValueError):
+        # ValueError: repository without any commit
+        print("I tried to find a git repository in current "
+              "and parent directories but did not find any.")
+        return None
+
+    key = (repo.working_dir, git_hash, diff_dir, max_diff_size)
+    with _git_cache_lock:
+        if key not in _git_cache:
+            try:
+                _git_cache[key] = _collect_git_info(repo, git_hash, diff_dir, max_diff_size)
+            except git.GitCommandError as e:
+                print("Could not compute the git diff: {}".format(e))
+                return None
+    return dict(_git_cache[key])
+
+
+def _collect_git_info(repo, git_hash, diff_dir, max_diff_size):
+    info = {'git_hash': git_hash}
+    diff = repo.git.diff(repo.head.commit.tree)
+    if max_diff_size is not None:
+        info['git_diff_truncated'] = len(diff) > max_diff_size
+        diff = diff[:max_diff_size]
+    if diff_dir is None:
+        info['git_diff'] = diff
+        return info
+    try:
+        info['git_diff_file'] = _write_diff(diff, diff_dir)
+    except (IOError, OSError) as e:
+        warnings.warn("could not write the git diff to {} ({}), it is stored in the config instead"
+                      .format(diff_dir, e))
+        info['git_diff'] = diff
+    return info
+
+
+def _write_diff(diff, diff_dir):
+    # content-addressed: identical diffs are written once
+    data = diff.encode('utf-8')
+    filename = os.path.join(diff_dir, hashlib.sha1(data).hexdigest() + '.diff.gz')
+    if not os.path.exists(filename):
+        if not os.path.isdir(diff_dir):
+            os.makedirs(diff_dir)
+        tmp_filename = '{}.{}.tmp'.format(filename, os.getpid())
+        with gzip.open(tmp_filename, 'wb') as f:
+            f.write(data)
+        _replace(tmp_filename, filename)
+    return filename
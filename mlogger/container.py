@@ -1,11 +1,18 @@
 import copy
 import mlogger
-import json
 import numpy as np
+import time as _time
 from builtins import dict
 from collections import defaultdict, OrderedDict
 
+from . import profiler, registry
+from .serialization import infer_format, save_state, load_state, Journal
 
+# keys of the state dict of a container that are not children
+_RESERVED_KEYS = ('repr', '__type__', '__args__')
+
+
+@registry.register
 class Container(object):
 
     def __init__(self, **kwargs):
@@ -14,11 +21,14 @@ class Container(object):
         super(Container, self).__init__()
 
         object.__setattr__(self, '_children_dict', {})
+        object.__setattr__(self, '_journals', {})
 
         for (key, value) in kwargs.items():
             setattr(self, key, value)
 
     def __setattr__(self, key, value):
+        if key in _RESERVED_KEYS:
+            raise ValueError("'{}' is reserved for the state dict of the container".format(key))
         if not isinstance(value, (mlogger.metric.Base, mlogger.Config, Container)):
             raise TypeError("Container object cannot store object with type '{}' (error for key {})"
                             .format(type(value), key))
@@ -30,19 +40,30 @@ class Container(object):
         object.__delattr__(self, key)
         del self._children_dict[key]
 
-    def state_dict(self):
+    def state_dict(self, history_arrays=False):
+        """
+        * history_arrays:
+            if True, the histories of scalar values are float64 arrays (views
+            on the histories, without copy) instead of lists
+        """
         state = {}
         state['repr'] = repr(self)
+        if registry.name_of(type(self)) is not None:
+            state['__type__'] = registry.name_of(type(self))
+            state['__args__'] = {}
         for key, value in self._children_dict.items():
-            state[key] = value.state_dict()
+            if isinstance(value, (mlogger.metric.Base, Container)):
+                state[key] = value.state_dict(history_arrays=history_arrays)
+            else:
+                state[key] = value.state_dict()
         return state
 
     def load_state_dict(self, state_dict):
         for (key, new_state) in state_dict.items():
-            if key == 'repr' or 'repr' not in new_state:
+            if key in _RESERVED_KEYS:
                 continue
 
-            new_object = eval('mlogger.' + new_state['repr'])
+            new_object = registry.construct(new_state)
             new_object.load_state_dict(new_state)
             setattr(self, key, new_object)
 
@@ -68,10 +89,52 @@ class Container(object):
                 named_metrics_list.append((name, child))
             elif isinstance(child, Container):
                 for child_metric_name, child_metric in child.named_metrics():
-                    print(name, child_metric_name)
                     named_metrics_list.append(("{}.{}".format(name, child_metric_name), child_metric))
         return named_metrics_list
 
+    def log_all(self, time=None):
+        """ Log all metrics of the container (and of nested containers) with
+        one event time: time if it is given, otherwise the same wall-clock time
+        for all time-indexed metrics. Metrics plotted on the same window are
+        sent to the plotter in one update.
+        """
+        now = _time.time()
+        metrics = self.metrics()
+
+        plot_groups = OrderedDict()
+        for metric in metrics:
+            event_time, value = metric._log(time, now)
+            if metric._plotter is not None:
+                key = (id(metric._plotter), metric._plot_title)
+                if key not in plot_groups:
+                    plot_groups[key] = (metric._plotter, metric._plot_title, [])
+                plot_groups[key][2].append((metric._plot_legend, event_time, value))
+
+        for plotter, plot_title, points in plot_groups.values():
+            profiler.call(self, 'plotter', plotter._update_xy_group, plot_title, points)
+
+        for metric in metrics:
+            profiler.call_hooks(metric, 'hooks_on_log', metric.hooks_on_log)
+
+        return self
+
+    def values(self):
+        """ Current values of all metrics of the container (and of nested
+        containers), in a flat dict with keys such as 'train.accuracy'.
+        """
+        return OrderedDict((name, metric.value) for name, metric in self.named_metrics())
+
+    def merge(self, other):
+        """ Merge the states of the metrics of other (for instance the container
+        of another process) into the metrics with the same names in this
+        container. Metrics that do not support merging are left unchanged.
+        """
+        other_metrics = dict(other.named_metrics())
+        for name, metric in self.named_metrics():
+            if name in other_metrics and metric.mergeable:
+                metric.merge(other_metrics[name])
+        return self
+
     def plot_on(self, plotter):
         for child in self.children():
             if isinstance(child, Container):
@@ -85,19 +148,61 @@ class Container(object):
                 if plot_title is not None:
                     child.plot_on(plotter, plot_title, plot_legend)
 
+    def profile_report(self):
+        """ Table of the number of calls and time spent in mlogger by the
+        metrics of the container (and of nested containers), recorded while
+        mlogger.profiler is enabled.
+        """
+        return profiler.report(self._named_objects())
+
+    def _named_objects(self, prefix=''):
+        # (name, object) of the container, nested containers and metrics
+        objects = [(prefix[:-1] or '(container)', self)]
+        for name, child in self.named_children():
+            if isinstance(child, Container):
+                objects += child._named_objects(prefix + name + '.')
+            elif isinstance(child, mlogger.metric.Base):
+                objects.append((prefix + name, child))
+        return objects
+
     def __repr__(self):
         _repr = "Container()"
         return _repr
 
-    def save_to(self, filename):
-        with open(filename, "w") as f:
-            json.dump(self.state_dict(), f)
-
-
-def load_container(filename):
-    with open(filename, "r") as f:
-        state_dict = json.load(f)
-
-    container = eval("mlogger." + state_dict['repr'])
+    def save_to(self, filename, format=None):
+        """
+        * format:
+            - 'json': a single JSON file (default)
+            - 'npz': a binary archive with one float64 array per history
+            - 'journal': an append-only journal (.jsonl) where each call after
+              the first one only appends what has changed since the previous call
+            - if None, inferred from the extension of filename
+        """
+        profiler.call(self, 'save_to', self._save_to, filename, format)
+
+    def _save_to(self, filename, format):
+        format = infer_format(filename, format)
+        if format == 'journal':
+            if filename not in self._journals:
+                self._journals[filename] = Journal(filename)
+            self._journals[filename].save(self)
+        elif format == 'npz':
+            # the histories are written from their buffers
+            save_state(self.state_dict(history_arrays=True), filename, format)
+        else:
+            save_state(self.state_dict(), filename, format)
+
+
+def load_container(filename, format=None, lazy=False):
+    """
+    * format:
+        format of the file, inferred from its extension if None (see Container.save_to)
+    * lazy:
+        if True, the histories are memory-mapped from the file and only read from
+        disk when they are accessed (requires the 'npz' format)
+    """
+    state_dict = load_state(filename, format, lazy)
+
+    container = registry.construct(state_dict)
     container.load_state_dict(state_dict)
     return container
@@ -1,8 +1,16 @@
 import mlogger
 
 mlogger._time_indexing = False
+mlogger._retention = None
 
 
 def use_time_indexing(use=True):
     assert use is True or use is False
     mlogger._time_indexing = use
+
+
+def use_retention(retention=None):
+    """ Set the default retention policy (mlogger.Retention) of the
+    histories of metrics created afterwards. None keeps all logged points.
+    """
+    mlogger._retention = retention
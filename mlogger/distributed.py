@@ -0,0 +1,101 @@
+import numpy as np
+
+from .metric.base import reduce_packed
+
+
+def reduce(objects):
+    """ Merge the states of a list of metrics (or containers) into the first
+    one, and return it.
+    """
+    first = objects[0]
+    for other in objects[1:]:
+        first.merge(other)
+    return first
+
+
+def all_reduce(container, all_reduce_fn=None, group=None):
+    """ Merge in place the states of the metrics of container across processes,
+    so that every process ends up with the same reduced states.
+
+    The states of all metrics are packed in two float64 buffers (one reduced
+    with a sum, one with a max), so that only two collective operations are
+    made, whatever the number of metrics. Metrics whose state cannot be reduced
+    element-wise (e.g. Simple, Quantile, WindowedAverage, EMA) are left unchanged.
+    All processes must have containers with the same metrics.
+
+    * all_reduce_fn:
+        function (array, op) -> array reducing array across processes, with op
+        'sum' or 'max'. If None, torch.distributed is used (with group).
+        See also PipeGroup for a backend based on multiprocessing pipes.
+    """
+    if all_reduce_fn is None:
+        all_reduce_fn = torch_all_reduce_fn(group)
+
+    metrics = [metric for _, metric in sorted(container.named_metrics(), key=lambda x: x[0])
+               if metric.packable]
+
+    # layout: each entry goes to the 'sum' or 'max' buffer ('min' entries are negated)
+    packed = [metric._pack() for metric in metrics]
+    ops = [np.asarray(metric._reduce_ops()) for metric in metrics]
+    all_ops = np.concatenate(ops) if ops else np.empty(0, dtype=str)
+    all_packed = np.concatenate(packed) if packed else np.empty(0)
+    is_sum = all_ops == 'sum'
+    sign = np.where(all_ops == 'min', -1., 1.)
+
+    reduced = np.empty_like(all_packed)
+    reduced[is_sum] = all_reduce_fn(all_packed[is_sum], 'sum')
+    reduced[~is_sum] = sign[~is_sum] * all_reduce_fn(sign[~is_sum] * all_packed[~is_sum], 'max')
+
+    start = 0
+    for metric, metric_packed in zip(metrics, packed):
+        metric._unpack(reduced[start:start + len(metric_packed)])
+        start += len(metric_packed)
+
+    return container
+
+
+def torch_all_reduce_fn(group=None):
+    import torch
+    import torch.distributed as dist
+
+    ops = {'sum': dist.ReduceOp.SUM, 'max': dist.ReduceOp.MAX}
+
+    def all_reduce_fn(array, op):
+        tensor = torch.from_numpy(np.ascontiguousarray(array))
+        # NCCL only reduces CUDA tensors
+        if dist.get_backend(group) == 'nccl':
+            tensor = tensor.cuda()
+        dist.all_reduce(tensor, op=ops[op], group=group)
+        return tensor.cpu().numpy()
+
+    return all_reduce_fn
+
+
+class PipeGroup(object):
+    def __init__(self, world_size):
+        """ Local all-reduce backend for world_size processes created with
+        multiprocessing, communicating through pipes: the group is created
+        before the processes, and process i uses group.all_reduce_fn(i).
+        """
+        import multiprocessing
+
+        self.world_size = world_size
+        self._pipes = [multiprocessing.Pipe() for _ in range(world_size - 1)]
+
+    def all_reduce_fn(self, rank):
+        assert 0 <= rank < self.world_size
+
+        def all_reduce_fn(array, op):
+            if rank == 0:
+                # gather, reduce and broadcast from rank 0
+                arrays = [array] + [parent.recv() for parent, _ in self._pipes]
+                reduced = reduce_packed([op] * len(array), arrays)
+                for parent, _ in self._pipes:
+                    parent.send(reduced)
+                return reduced
+            else:
+                child = self._pipes[rank - 1][1]
+                child.send(np.asarray(array))
+                return child.recv()
+
+        return all_reduce_fn
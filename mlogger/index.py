@@ -0,0 +1,221 @@
+import json
+import os
+import sqlite3
+import numpy as np
+
+from .metric.history import ROLLUP_FIELDS
+from .serialization import EXTENSIONS, load_state
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    n_points INTEGER NOT NULL,
+    final_value REAL,
+    final_time REAL,
+    min REAL,
+    argmin_time REAL,
+    max REAL,
+    argmax_time REAL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE TABLE IF NOT EXISTS config (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value,
+    PRIMARY KEY (run_id, name, key)
+);
+CREATE INDEX IF NOT EXISTS metrics_name ON metrics(name);
+CREATE INDEX IF NOT EXISTS config_key ON config(key);
+"""
+
+
+class Index(object):
+    def __init__(self, filename):
+        """ Index of the containers saved in a directory (see update), stored
+        in the sqlite database filename, with the tables:
+        * runs:
+            one row per saved file (path, mtime, size, and error if the file
+            could not be read as a container)
+        * metrics:
+            one row per metric of each run (name such as 'val.acc', type,
+            n_points, final_value, final_time, min, argmin_time, max,
+            argmax_time), computed from the logged points
+        * config:
+            one row per field of each Config of each run (name of the
+            Config in the container, key and value)
+        """
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(_SCHEMA)
+
+    def update(self, directory, recursive=True):
+        """ Scan directory for saved containers (files with the extensions
+        of the formats of Container.save_to), and index the new or modified
+        ones (according to their modification time and size). Runs whose file
+        has been deleted are removed from the index. Returns the number of
+        files (re-)scanned.
+        """
+        directory = os.path.abspath(directory)
+        known = dict((row['path'], (row['mtime'], row['size'])) for row in
+                     self.connection.execute("SELECT path, mtime, size FROM runs"))
+
+        found = set()
+        n_scanned = 0
+        with self.connection:
+            for path in _find_files(directory, recursive):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.add(path)
+                if known.get(path) == (stat.st_mtime, stat.st_size):
+                    continue
+                self._scan(path, stat)
+                n_scanned += 1
+
+            for path in known:
+                if path not in found and _is_under(path, directory):
+                    self.connection.execute("DELETE FROM runs WHERE path = ?", (path,))
+
+        return n_scanned
+
+    def _scan(self, path, stat):
+        self.connection.execute("DELETE FROM runs WHERE path = ?", (path,))
+        try:
+            state_dict = load_state(path, lazy=path.endswith('.npz'))
+            if not isinstance(state_dict, dict) or not state_dict.get('repr', '').startswith('Container('):
+                raise ValueError("not a saved container")
+            metrics, configs = [], []
+            _summarize(state_dict, '', metrics, configs)
+            error = None
+        except Exception as e:
+            metrics, configs = [], []
+            error = "{}: {}".format(type(e).__name__, e)
+
+        run_id = self.connection.execute(
+            "INSERT INTO runs (path, mtime, size, error) VALUES (?, ?, ?, ?)",
+            (path, stat.st_mtime, stat.st_size, error)).lastrowid
+        self.connection.executemany(
+            "INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(run_id,) + row for row in metrics])
+        self.connection.executemany(
+            "INSERT INTO config VALUES (?, ?, ?, ?)",
+            [(run_id,) + row for row in configs])
+
+    def query(self, sql, parameters=()):
+        """ Rows (sqlite3.Row) returned by the SQL query sql on the index.
+        """
+        return self.connection.execute(sql, parameters).fetchall()
+
+    def best(self, metric, mode='max', n=10):
+        """ The n runs with the best value of metric (e.g. 'val.acc'), as
+        rows with the path of the run, its best value and the time at
+        which it was reached.
+        * mode:
+            'max' if higher values are better, 'min' otherwise
+        """
+        assert mode in ('max', 'min'), "mode should be 'max' or 'min' (got {})".format(mode)
+        order = 'DESC' if mode == 'max' else 'ASC'
+        sql = ("SELECT runs.path AS path, metrics.{mode} AS value, metrics.arg{mode}_time AS time "
+               "FROM metrics JOIN runs ON runs.id = metrics.run_id "
+               "WHERE metrics.name = ? AND metrics.{mode} IS NOT NULL "
+               "ORDER BY metrics.{mode} {order} LIMIT ?").format(mode=mode, order=order)
+        return self.query(sql, (metric, n))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def build_index(directory, filename=None, recursive=True):
+    """ Create or update the index of the containers saved in directory
+    (see Index). The index is stored in directory/index.sqlite by default.
+    """
+    if filename is None:
+        filename = os.path.join(directory, 'index.sqlite')
+    index = Index(filename)
+    index.update(directory, recursive)
+    return index
+
+
+def _find_files(directory, recursive):
+    for root, dirs, files in os.walk(directory):
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in EXTENSIONS:
+                yield os.path.join(root, name)
+        if not recursive:
+            break
+
+
+def _is_under(path, directory):
+    return path.startswith(os.path.join(directory, ''))
+
+
+def _summarize(state, prefix, metrics, configs):
+    # rows of the metrics and config tables for a container state
+    for key, value in state.items():
+        if not isinstance(value, dict) or 'repr' not in value:
+            continue
+        name = prefix + key
+        type_ = value.get('__type__') or value['repr'].split('(')[0]
+        if type_ == 'Container':
+            _summarize(value, name + '.', metrics, configs)
+        elif type_ == 'Config':
+            for field, field_value in value['_state'].items():
+                if not isinstance(field_value, (int, float, str)) or isinstance(field_value, bool):
+                    field_value = json.dumps(field_value)
+                configs.append((name, field, field_value))
+        elif 'history' in value:
+            metrics.append((name, type_) + _summarize_history(value['history']))
+
+
+def _summarize_history(history):
+    # n_points, final_value, final_time, min, argmin_time, max, argmax_time
+    times = np.asarray(history['times'], dtype=np.float64)
+    try:
+        values = np.asarray(history['values'], dtype=np.float64)
+        assert values.ndim == 1
+    except (AssertionError, TypeError, ValueError):
+        # non-scalar values (e.g. histograms)
+        return (len(times),) + (None,) * 6
+
+    # points evicted by the retention policy: extrema of each bucket, at
+    # the middle of the bucket
+    n_points = len(times)
+    rollups = [np.asarray(level, dtype=np.float64).reshape(-1, len(ROLLUP_FIELDS))
+               for level in history.get('rollups', [])]
+    if rollups:
+        rollups = np.concatenate(rollups)
+        start, end, count, _, low, high = rollups.T
+        n_points += int(count.sum())
+        middle = (start + end) / 2
+        times = np.concatenate([middle, middle, times])
+        values = np.concatenate([low, high, values])
+
+    final_value = float(history['values'][-1]) if len(history['times']) else None
+    final_time = float(history['times'][-1]) if len(history['times']) else None
+    if not len(values) or np.all(np.isnan(values)):
+        return (n_points, final_value, final_time) + (None,) * 4
+
+    argmin, argmax = np.nanargmin(values), np.nanargmax(values)
+    return (n_points, final_value, final_time,
+            float(values[argmin]), float(times[argmin]),
+            float(values[argmax]), float(times[argmax]))
@@ -1,18 +1,20 @@
 import numpy as np
 import time
 
-from collections import defaultdict, OrderedDict
-from future.utils import viewitems
-
+from .. import profiler
+from ..registry import register
 from .base import Base
-from .to_float import to_float
+from .distribution import Histogram, Quantile
+from .to_float import to_float, to_array, to_tensor, is_tensor
 
 
 __all__ = [
-    "Simple", "TNT", "Timer", "Maximum", "Minimum", "Average", "Sum"
+    "Simple", "TNT", "Timer", "Maximum", "Minimum", "Average", "Sum", "EMA", "WindowedAverage",
+    "Histogram", "Quantile"
 ]
 
 
+@register
 class Simple(Base):
     def __init__(self, time_indexing=None, plotter=None, plot_title=None, plot_legend=None):
         super(Simple, self).__init__(time_indexing, plotter, plot_title, plot_legend)
@@ -43,6 +45,7 @@ class Simple(Base):
         return repr_
 
 
+# not registered: the wrapped torchnet meter cannot be rebuilt from a saved state
 class TNT(Base):
     def __init__(self, tnt_meter, time_indexing=None, plotter=None, plot_title=None, plot_legend=None):
         super(TNT, self).__init__(time_indexing, plotter, plot_title, plot_legend)
@@ -69,6 +72,7 @@ class TNT(Base):
         return repr_
 
 
+@register
 class Timer(Base):
     def __init__(self, plotter=None, plot_title=None, plot_legend=None):
         super(Timer, self).__init__(False, plotter, plot_title, plot_legend)
@@ -76,6 +80,7 @@ class Timer(Base):
     def reset(self):
         self.start = time.time()
         self.current = self.start
+        self._reset_sink()
         return self
 
     def _update(self, current_time=None):
@@ -86,9 +91,11 @@ class Timer(Base):
 
     @property
     def value(self):
+        self._sync()
         return self.current - self.start
 
     def state_dict_extra(self, state):
+        self._sync()
         state['start'] = self.start
         state['current'] = self.current
 
@@ -96,6 +103,20 @@ class Timer(Base):
         self.start = state['start']
         self.current = state['current']
 
+    def _reduce_ops(self):
+        # earliest start, latest current time
+        return ('min', 'max')
+
+    def _pack(self):
+        self._sync()
+        return np.array([self.start, self.current])
+
+    def _unpack(self, packed):
+        self.start, self.current = float(packed[0]), float(packed[1])
+
+    def _init_args(self):
+        return {}
+
     def __repr__(self):
         repr_ = "Timer({plotter}, '{plot_title}', '{plot_legend}')"
         repr_ = repr_.format(plotter=None,
@@ -104,26 +125,78 @@ class Timer(Base):
         return repr_
 
 
+@register
 class Maximum(Base):
+    _supports_defer_sync = True
+
     def __init__(self, time_indexing=None, plotter=None, plot_title=None, plot_legend=None):
         super(Maximum, self).__init__(time_indexing, plotter, plot_title, plot_legend)
 
     def reset(self):
         self._val = -np.inf
+        self._pending = None
         self.hooks_on_new_max = ()
+        self._reset_sink()
         return self
 
     def _update(self, val, n=None):
+        if self._defer_sync and is_tensor(val):
+            assert val.numel() == 1, \
+                "val should have one element (got {})".format(val.numel())
+            self._defer(to_tensor(val)[0])
+            return
         val = to_float(val)
         if val > self._val:
             self._val = val
-            for hook in self.hooks_on_new_max:
-                hook()
+            profiler.call_hooks(self, 'hooks_on_new_max', self.hooks_on_new_max)
+
+    def _defer(self, val):
+        if self._pending is not None:
+            val = self._pending.fmax(val)
+        self._pending = val
+
+    def _sync(self):
+        previous = self._val
+        super(Maximum, self)._sync()
+        if self._val > previous:
+            # new maximum from other threads or processes (see thread_safe and
+            # share), whose copies of the metric have no hooks
+            profiler.call_hooks(self, 'hooks_on_new_max', self.hooks_on_new_max)
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            self._update(to_float(pending))
+
+    def _update_batch(self, values, weights=None):
+        if self._defer_sync and is_tensor(values):
+            values = to_tensor(values)
+            if values.numel():
+                # NaNs are ignored, like in _update
+                self._defer(values.nan_to_num(nan=-float('inf')).max())
+            return
+        values = to_array(values)
+        if not values.size:
+            return
+        # fmax ignores NaNs, like the element-wise comparison in _update
+        val = float(np.fmax.reduce(values))
+        if val > self._val:
+            self._val = val
+            profiler.call_hooks(self, 'hooks_on_new_max', self.hooks_on_new_max)
 
     def hook_on_new_max(self, hook):
         self.hooks_on_new_max += (hook,)
 
+    def _reduce_ops(self):
+        return ('max',)
+
+    def _pack(self):
+        self._sync()
+        return np.array([self._val])
+
+    def _unpack(self, packed):
+        self._val = float(packed[0])
+
     def state_dict_extra(self, state):
+        self._sync()
         state['val'] = self._val
 
     def load_state_dict_extra(self, state):
@@ -131,6 +204,7 @@ class Maximum(Base):
 
     @property
     def value(self):
+        self._sync()
         return self._val
 
     def __repr__(self):
@@ -142,26 +216,78 @@ class Maximum(Base):
         return repr_
 
 
+@register
 class Minimum(Base):
+    _supports_defer_sync = True
+
     def __init__(self, time_indexing=None, plotter=None, plot_title=None, plot_legend=None):
         super(Minimum, self).__init__(time_indexing, plotter, plot_title, plot_legend)
 
     def reset(self):
         self._val = np.inf
+        self._pending = None
         self.hooks_on_new_min = ()
+        self._reset_sink()
         return self
 
     def _update(self, val, n=None):
+        if self._defer_sync and is_tensor(val):
+            assert val.numel() == 1, \
+                "val should have one element (got {})".format(val.numel())
+            self._defer(to_tensor(val)[0])
+            return
         val = to_float(val)
         if val < self._val:
             self._val = val
-            for hook in self.hooks_on_new_min:
-                hook()
+            profiler.call_hooks(self, 'hooks_on_new_min', self.hooks_on_new_min)
+
+    def _defer(self, val):
+        if self._pending is not None:
+            val = self._pending.fmin(val)
+        self._pending = val
+
+    def _sync(self):
+        previous = self._val
+        super(Minimum, self)._sync()
+        if self._val < previous:
+            # new minimum from other threads or processes (see thread_safe and
+            # share), whose copies of the metric have no hooks
+            profiler.call_hooks(self, 'hooks_on_new_min', self.hooks_on_new_min)
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            self._update(to_float(pending))
+
+    def _update_batch(self, values, weights=None):
+        if self._defer_sync and is_tensor(values):
+            values = to_tensor(values)
+            if values.numel():
+                # NaNs are ignored, like in _update
+                self._defer(values.nan_to_num(nan=float('inf')).min())
+            return
+        values = to_array(values)
+        if not values.size:
+            return
+        # fmin ignores NaNs, like the element-wise comparison in _update
+        val = float(np.fmin.reduce(values))
+        if val < self._val:
+            self._val = val
+            profiler.call_hooks(self, 'hooks_on_new_min', self.hooks_on_new_min)
 
     def hook_on_new_min(self, hook):
         self.hooks_on_new_min += (hook,)
 
+    def _reduce_ops(self):
+        return ('min',)
+
+    def _pack(self):
+        self._sync()
+        return np.array([self._val])
+
+    def _unpack(self, packed):
+        self._val = float(packed[0])
+
     def state_dict_extra(self, state):
+        self._sync()
         state['val'] = self._val
 
     def load_state_dict_extra(self, state):
@@ -169,6 +295,7 @@ class Minimum(Base):
 
     @property
     def value(self):
+        self._sync()
         return self._val
 
     def __repr__(self):
@@ -184,25 +311,93 @@ class Accumulator_(Base):
     """
     Credits to the authors of pytorch/tnt for this.
     """
+    _supports_defer_sync = True
+
     def __init__(self, time_indexing, plotter=None, plot_title=None, plot_legend=None):
         super(Accumulator_, self).__init__(time_indexing, plotter, plot_title, plot_legend)
 
     def reset(self):
         self._avg = 0
         self._total_weight = 0
+        self._pending_sum = None
+        self._pending_weight = 0
+        self._reset_sink()
         return self
 
     def _update(self, val, weighting=1):
+        if self._defer_sync and is_tensor(val):
+            assert val.numel() == 1, \
+                "val should have one element (got {})".format(val.numel())
+            val = to_tensor(val)[0]
+            if not is_tensor(weighting):
+                weighting = to_float(weighting)
+                assert weighting > 0
+            self._defer(val * weighting, weighting)
+            return
         val, weighting = to_float(val), to_float(weighting)
         assert weighting > 0
+        self._fold(val, weighting)
+
+    def _update_batch(self, values, weights=None):
+        if self._defer_sync and is_tensor(values):
+            values = to_tensor(values)
+            if weights is None:
+                self._defer(values.sum(), values.numel())
+            else:
+                weights = values.new_tensor(weights) if not is_tensor(weights) else weights.to(values)
+                weights = weights.reshape(-1).expand_as(values)
+                self._defer((values * weights).sum(), weights.sum())
+            return
+        values = to_array(values)
+        if not values.size:
+            return
+        if weights is None:
+            weighting = float(values.size)
+            total = float(values.sum())
+        else:
+            weights = np.broadcast_to(to_array(weights), values.shape)
+            assert np.all(weights > 0)
+            weighting = float(weights.sum())
+            total = float(np.dot(values, weights))
+        self._fold(total / weighting, weighting)
+
+    def _fold(self, val, weighting):
+        # fold a (weighted) mean val into the running average
         r = self._total_weight / (weighting + self._total_weight)
         self._avg = r * self._avg + (1 - r) * val
         self._total_weight += weighting
 
+    def _defer(self, weighted_sum, weighting):
+        if self._pending_sum is not None:
+            weighted_sum = self._pending_sum + weighted_sum
+        self._pending_sum = weighted_sum
+        self._pending_weight = self._pending_weight + weighting
+
+    def _sync(self):
+        super(Accumulator_, self)._sync()
+        if self._pending_sum is not None:
+            total, weighting = to_float(self._pending_sum), to_float(self._pending_weight)
+            self._pending_sum, self._pending_weight = None, 0
+            if weighting:
+                self._fold(total / weighting, weighting)
+
     def state_dict_extra(self, state):
+        self._sync()
         state['avg'] = self._avg
         state['total_weight'] = self._total_weight
 
+    def _reduce_ops(self):
+        # weighted sum and total weight
+        return ('sum', 'sum')
+
+    def _pack(self):
+        self._sync()
+        return np.array([self._avg * self._total_weight, self._total_weight])
+
+    def _unpack(self, packed):
+        self._total_weight = float(packed[1])
+        self._avg = float(packed[0]) / self._total_weight if self._total_weight else 0.
+
     def load_state_dict_extra(self, state):
         self._avg = state['avg']
         self._total_weight = state['total_weight']
@@ -212,12 +407,14 @@ class Accumulator_(Base):
         raise NotImplementedError("Accumulator should be subclassed")
 
 
+@register
 class Average(Accumulator_):
     def __init__(self, time_indexing=None, plotter=None, plot_title=None, plot_legend=None):
         super(Average, self).__init__(time_indexing, plotter, plot_title, plot_legend)
 
     @property
     def value(self):
+        self._sync()
         return self._avg
 
     def __repr__(self):
@@ -229,12 +426,14 @@ class Average(Accumulator_):
         return repr_
 
 
+@register
 class Sum(Accumulator_):
     def __init__(self, time_indexing=None, plotter=None, plot_title=None, plot_legend=None):
         super(Sum, self).__init__(time_indexing, plotter, plot_title, plot_legend)
 
     @property
     def value(self):
+        self._sync()
         return self._avg * self._total_weight
 
     def __repr__(self):
@@ -244,3 +443,167 @@ class Sum(Accumulator_):
                              plot_title=self._plot_title,
                              plot_legend=self._plot_legend)
         return repr_
+
+
+@register
+class EMA(Accumulator_):
+    _supports_defer_sync = False
+
+    def __init__(self, decay, time_indexing=None, plotter=None, plot_title=None, plot_legend=None):
+        """ Exponential moving average: each update decays the weight of the
+        previous values by decay. The average is normalized by the total
+        (decayed) weight, so that it is not biased towards 0 at the beginning.
+        Deferred synchronization (defer_sync) is not supported.
+        """
+        assert 0 <= decay < 1
+        self._decay = decay
+        super(EMA, self).__init__(time_indexing, plotter, plot_title, plot_legend)
+
+    def _update(self, val, weighting=1):
+        val, weighting = to_float(val), to_float(weighting)
+        assert weighting > 0
+        self._total_weight *= self._decay
+        self._fold(val, weighting)
+
+    def _update_batch(self, values, weights=None):
+        values = to_array(values)
+        if not values.size:
+            return
+        if weights is None:
+            weights = np.ones_like(values)
+        else:
+            weights = np.broadcast_to(to_array(weights), values.shape)
+            assert np.all(weights > 0)
+        # decay of each value at the end of the batch
+        decays = self._decay ** np.arange(values.size - 1, -1, -1, dtype=np.float64)
+        weights = decays * weights
+        weighting = float(weights.sum())
+        self._total_weight *= self._decay ** values.size
+        self._fold(float(np.dot(values, weights)) / weighting, weighting)
+
+    @property
+    def value(self):
+        self._sync()
+        return self._avg
+
+    @property
+    def packable(self):
+        # merged states are summed without decay: states accumulated over
+        # time (by other threads or processes, see thread_safe and share)
+        # would never decay. EMAs can still be merged (see merge).
+        return False
+
+    def _init_args(self):
+        return {'decay': self._decay, 'time_indexing': self._time_indexing}
+
+    def __repr__(self):
+        repr_ = "EMA({decay}, {time_indexing}, {plotter}, '{plot_title}', '{plot_legend}')"
+        repr_ = repr_.format(decay=self._decay,
+                             time_indexing=self._time_indexing,
+                             plotter=None,
+                             plot_title=self._plot_title,
+                             plot_legend=self._plot_legend)
+        return repr_
+
+
+@register
+class WindowedAverage(Base):
+    def __init__(self, window, time_indexing=None, plotter=None, plot_title=None, plot_legend=None):
+        """ (Weighted) average of the last window values, stored in a ring
+        buffer: updates and value are O(1) whatever the size of the window.
+        """
+        assert window >= 1
+        self._window = window
+        super(WindowedAverage, self).__init__(time_indexing, plotter, plot_title, plot_legend)
+
+    def reset(self):
+        self._values = np.zeros(self._window)
+        self._weights = np.zeros(self._window)
+        self._position = 0
+        self._count = 0
+        self._weighted_sum = 0.
+        self._total_weight = 0.
+        return self
+
+    def _update(self, val, weighting=1):
+        val, weighting = to_float(val), to_float(weighting)
+        assert weighting > 0
+
+        i = self._position
+        if self._count == self._window:
+            self._weighted_sum -= self._values[i] * self._weights[i]
+            self._total_weight -= self._weights[i]
+        else:
+            self._count += 1
+
+        self._values[i], self._weights[i] = val, weighting
+        self._weighted_sum += val * weighting
+        self._total_weight += weighting
+        self._position = (i + 1) % self._window
+
+        # recompute the sums once per turn of the ring buffer to avoid
+        # accumulating rounding errors
+        if not self._position:
+            self._recompute()
+
+    def _update_batch(self, values, weights=None):
+        values = to_array(values)
+        if weights is None:
+            weights = np.ones_like(values)
+        else:
+            weights = np.broadcast_to(to_array(weights), values.shape)
+            assert np.all(weights > 0)
+
+        # only the last window values matter
+        values, weights = values[-self._window:], weights[-self._window:]
+        indices = (self._position + np.arange(values.size)) % self._window
+
+        # empty slots have a weight of 0
+        self._weighted_sum += float(np.dot(values, weights) -
+                                    np.dot(self._values[indices], self._weights[indices]))
+        self._total_weight += float(weights.sum() - self._weights[indices].sum())
+        self._values[indices] = values
+        self._weights[indices] = weights
+
+        wrapped = self._position + values.size >= self._window
+        self._count = min(self._count + values.size, self._window)
+        self._position = (self._position + values.size) % self._window
+
+        # as in _update, recompute the sums once per turn of the ring buffer
+        if wrapped:
+            self._recompute()
+
+    def _recompute(self):
+        self._weighted_sum = float(np.dot(self._values, self._weights))
+        self._total_weight = float(self._weights.sum())
+
+    def state_dict_extra(self, state):
+        state['values'] = self._values.tolist()
+        state['weights'] = self._weights.tolist()
+        state['position'] = self._position
+        state['count'] = self._count
+
+    def load_state_dict_extra(self, state):
+        self._values = np.array(state['values'], dtype=np.float64)
+        self._weights = np.array(state['weights'], dtype=np.float64)
+        self._position = state['position']
+        self._count = state['count']
+        self._recompute()
+
+    @property
+    def value(self):
+        if not self._total_weight:
+            return 0.
+        return self._weighted_sum / self._total_weight
+
+    def _init_args(self):
+        return {'window': self._window, 'time_indexing': self._time_indexing}
+
+    def __repr__(self):
+        repr_ = "WindowedAverage({window}, {time_indexing}, {plotter}, '{plot_title}', '{plot_legend}')"
+        repr_ = repr_.format(window=self._window,
+                             time_indexing=self._time_indexing,
+                             plotter=None,
+                             plot_title=self._plot_title,
+                             plot_legend=self._plot_legend)
+        return repr_
@@ -1,19 +1,23 @@
+import copy
 import numpy as np
 import time
 
-from collections import defaultdict, OrderedDict
-from future.utils import viewitems
-
+from .. import profiler, registry
 from .history import History
-from .to_float import to_float
+from .to_float import to_float, to_array
 
 
 class Base(object):
+    # True if updates with tensors can be accumulated on their device (see defer_sync)
+    _supports_defer_sync = False
+
     def __init__(self, time_indexing=None, plotter=None, plot_title=None, plot_legend=None):
         """ Basic metric
         """
 
         self._time_indexing = time_indexing
+        self._defer_sync = False
+        self._sink = None
 
         self.init_history(time_indexing)
         self.reset()
@@ -31,6 +35,13 @@ class Base(object):
     def init_history(self, time_indexing):
         self._history = History(time_indexing)
 
+    def set_retention(self, retention):
+        """ Set the retention policy (mlogger.Retention) of the history of
+        the metric, or None to keep all logged points.
+        """
+        self._history.retention = retention
+        return self
+
     def reset_hooks_on_update(self):
         self.hooks_on_update = ()
 
@@ -43,15 +54,122 @@ class Base(object):
     def hook_on_log(self, hook):
         self.hooks_on_log += (hook,)
 
+    def defer_sync(self, use=True):
+        """ If use is True, updates with pytorch tensors are accumulated with
+        tensor operations on their device, and are only converted to float when
+        the metric is read (.value, .log() or .state_dict()). This avoids a
+        device synchronization on every update. Supported by Average, Sum,
+        Maximum and Minimum.
+        """
+        assert use is True or use is False
+        assert not use or self._supports_defer_sync, \
+            "{} does not support deferred synchronization".format(type(self).__name__)
+        assert not use or self._sink is None, "a shared or thread-safe metric cannot defer synchronization"
+        self._sync()
+        self._defer_sync = use
+        return self
+
+    def _sync(self):
+        # materialize pending tensor updates (see defer_sync), and read the
+        # state of a shared metric (see share)
+        if self._sink is not None:
+            self._unpack(self._sink.read())
+
+    def share(self, n_slots=64, context=None):
+        """ Move the state of the metric to shared memory, so that it can be
+        updated by up to n_slots processes at the same time (e.g. the workers
+        of a DataLoader), without any inter-process communication per update.
+        Returns a SharedSink, to pass to the processes and to update there with
+        .update or .update_batch. The metric itself is read as usual in this
+        process (.value, .log() or .state_dict()), and reflects the updates of
+        all the processes. Supported by the metrics whose state can be merged
+        element-wise (Average, Sum, Maximum, Minimum, Timer, Histogram), but
+        not by EMA, whose merged states would never decay.
+        context is the multiprocessing start method of the processes (default
+        start method if None).
+        """
+        # import here to avoid a circular import
+        from .shared import SharedSink
+
+        assert self._sink is None, "the metric is already shared or thread-safe"
+        assert not self._defer_sync, "a shared metric cannot defer synchronization"
+        self._sink = SharedSink(self, n_slots, context)
+        return self._sink
+
+    def thread_safe(self, use=True):
+        """ If use is True, the metric can be updated by several threads at
+        the same time: each thread updates its own copy of the metric, and the
+        copies are combined when the metric is read (.value, .log() or
+        .state_dict()), so that threads never wait on each other. Supported by
+        the metrics whose state can be merged element-wise (see share).
+        Hooks on new maxima and minima are called when the metric is read,
+        if the combined value has improved (also for shared metrics).
+        """
+        # import here to avoid a circular import
+        from .threaded import ThreadShards
+
+        assert use is True or use is False
+        if use and not isinstance(self._sink, ThreadShards):
+            assert self._sink is None, "a shared metric cannot be thread-safe"
+            assert not self._defer_sync, "a thread-safe metric cannot defer synchronization"
+            self._sink = ThreadShards(self)
+        elif not use and isinstance(self._sink, ThreadShards):
+            self._sync()
+            self._sink = None
+        self._history.thread_safe(use)
+        return self
+
+    def unshare(self):
+        """ Move the state of a shared metric (see share) back to this
+        process, and release the shared memory.
+        """
+        if self._sink is not None:
+            self._sync()
+            sink, self._sink = self._sink, None
+            sink.close(unlink=True)
+        return self
+
+    def _reset_sink(self):
+        # reset the state of all the processes or threads updating the metric
+        if self._sink is not None:
+            self._sink.clear()
+
+    def _clone(self):
+        # new metric with the same parameters, without history, plotter nor hooks
+        clone = copy.copy(self)
+        clone._sink = None
+        clone._plotter = None
+        clone.reset_hooks_on_update()
+        clone.reset_hooks_on_log()
+        clone.init_history(self._time_indexing)
+        clone.reset()
+        return clone
+
     def reset(self):
         raise NotImplementedError("reset should be re-implemented for each metric")
 
     def _update(self, *args, **kwargs):
         raise NotImplementedError("_update should be re-implemented for each metric")
 
+    def _update_batch(self, values, weights=None):
+        # generic fallback: one update per element
+        values = to_array(values)
+        if weights is None:
+            for val in values:
+                self._update(val)
+        else:
+            weights = np.broadcast_to(to_array(weights), values.shape)
+            for val, weighting in zip(values, weights):
+                self._update(val, weighting)
+
     def __repr__(self):
         raise NotImplementedError("__repr__ should be re-implemented for each metric")
 
+    def _init_args(self):
+        # keyword arguments of the constructor, stored in the state dict to
+        # rebuild the metric when it is loaded (see mlogger.registry)
+        return {'time_indexing': self._time_indexing}
+
     def state_dict_extra(self, state):
         raise NotImplementedError("state_dict_extra should be re-implemented for each metric")
 
@@ -62,51 +180,161 @@ class Base(object):
     def value(self):
         raise NotImplementedError("value should be re-implemented for each metric")
 
+    def _reduce_ops(self):
+        """ Reduction ('sum', 'max' or 'min') of each entry of the array
+        returned by _pack, for metrics whose state can be merged element-wise.
+        """
+        raise NotImplementedError("{} does not support merging".format(type(self).__name__))
+
+    def _pack(self):
+        # state of the metric as a flat float64 array (see _reduce_ops)
+        raise NotImplementedError("{} does not support merging".format(type(self).__name__))
+
+    def _unpack(self, packed):
+        raise NotImplementedError("{} does not support merging".format(type(self).__name__))
+
+    @property
+    def mergeable(self):
+        # True if the metric implements merge
+        return _overrides(self, 'merge') or _overrides(self, '_reduce_ops')
+
+    @property
+    def packable(self):
+        # True if the state of the metric can be reduced element-wise (see _reduce_ops)
+        return _overrides(self, '_reduce_ops')
+
+    def merge(self, other):
+        """ Combine the state of other, a metric of the same type (for
+        instance updated by another process), into the state of this metric.
+        The history is not merged.
+        """
+        assert type(other) is type(self), \
+            "cannot merge {} into {}".format(type(other).__name__, type(self).__name__)
+        self._unpack(reduce_packed(self._reduce_ops(), [self._pack(), other._pack()]))
+        return self
+
     def update(self, *args, **kwargs):
-        self._update(*args, **kwargs)
+        if profiler.enabled:
+            return self._profiled('update', self._update_any, args, kwargs)
+        self._update_any(*args, **kwargs)
         for hook in self.hooks_on_update:
             hook()
         return self
 
-    def log(self, time=None):
-        # get current value
-        value = self.value
+    def update_batch(self, values, weights=None):
+        """ Update the metric with all elements of values (and optionally
+        weights) at once. This is equivalent to calling update element by
+        element, except that hooks on update are called once per batch.
+        """
+        if profiler.enabled:
+            return self._profiled('update_batch', self._update_batch_any, (values, weights), {})
+        self._update_batch_any(values, weights)
+        for hook in self.hooks_on_update:
+            hook()
+        return self
 
-        event_time = time if time is not None else self._history.time()
+    def _update_any(self, *args, **kwargs):
+        if self._sink is not None:
+            self._sink.update(*args, **kwargs)
+        else:
+            self._update(*args, **kwargs)
 
-        self._history.log(event_time, value)
+    def _update_batch_any(self, values, weights=None):
+        if self._sink is not None:
+            self._sink.update_batch(values, weights)
+        else:
+            self._update_batch(values, weights)
+
+    def _profiled(self, section, update, args, kwargs):
+        # update recording its time (see mlogger.profiler), nested calls
+        # such as to_float are attributed to self
+        previous, profiler._current = profiler._current, self
+        try:
+            start = profiler.clock()
+            update(*args, **kwargs)
+            profiler.call_hooks(self, 'hooks_on_update', self.hooks_on_update)
+            profiler.record(self, section, profiler.clock() - start)
+        finally:
+            profiler._current = previous
+        return self
+
+    def log(self, time=None):
+        event_time, value = self._log(time)
 
         # plot current value
         if self._plotter is not None:
-            self._plotter._update_xy(title=self._plot_title, legend=self._plot_legend, x=event_time, y=value)
+            profiler.call(self, 'plotter', self._plotter._update_xy,
+                          title=self._plot_title, legend=self._plot_legend, x=event_time, y=value)
 
-        for hook in self.hooks_on_log:
-            hook()
+        if self.hooks_on_log:
+            profiler.call_hooks(self, 'hooks_on_log', self.hooks_on_log)
 
         return self
 
-    def state_dict(self):
+    def _log(self, time=None, now=None):
+        # store current value in history, without plotting it nor calling hooks
+        value = self.value
+
+        event_time = time if time is not None else self._history.time(now)
+
+        if profiler.enabled:
+            profiler.call(self, 'History.log', self._history.log, event_time, value)
+        else:
+            self._history.log(event_time, value)
+
+        return event_time, value
+
+    def state_dict(self, history_data=True, history_arrays=False):
         state = {}
         state['repr'] = repr(self)
-        state['history'] = self._history.state_dict()
+        if registry.name_of(type(self)) is not None:
+            state['__type__'] = registry.name_of(type(self))
+            state['__args__'] = self._init_args()
+        state['history'] = self._history.state_dict(data=history_data, arrays=history_arrays)
         state['plot_title'] = self._plot_title
         state['plot_legend'] = self._plot_legend
         self.state_dict_extra(state)
         return state
 
     def load_state_dict(self, state):
+        assert self._sink is None, "cannot load the state of a shared or thread-safe metric"
         self._history.load_state_dict(state['history'])
         self._plot_title = state['plot_title']
         self._plot_legend = state['plot_legend']
         self.load_state_dict_extra(state)
 
     def last_logged(self):
-        return self._history._last_value
+        return self._history.last_value
+
+    def logged_at(self, time):
+        """ Last value logged at or before time (None if there is none).
+        """
+        return self._history.at(time)
+
+    def logged_between(self, start=None, end=None):
+        """ Times and values (arrays) logged between start and end (included).
+        """
+        return self._history.between(start, end)
+
+    def mean_logged(self, start=None, end=None):
+        """ Mean of the values logged between start and end (included), or
+        of all logged values without bounds.
+        """
+        return self._history.mean(start, end)
+
+    def best_logged(self, mode='max'):
+        """ (time, value) of the maximal (mode='max') or minimal (mode='min')
+        logged value, in O(1). (None, None) if no value has been logged.
+        """
+        assert mode in ('max', 'min'), "mode should be 'max' or 'min' (got {})".format(mode)
+        if mode == 'max':
+            return self._history.argmax, self._history.max
+        return self._history.argmin, self._history.min
 
     def plot_on(self, plotter, plot_title, plot_legend=None):
-        # plot current state
-        x, y = self._history._times, self._history._values
-        assert len(x) == len(y)
+        # plot current state (zero-copy views on the history buffers if
+        # no point has been summarized by the retention policy)
+        x, y = self._history.series()
         if len(x):
             plotter._update_xy(plot_title, plot_legend, x, y)
 
@@ -116,3 +344,24 @@ class Base(object):
         self._plot_legend = plot_legend
 
         return self
+
+
+def _overrides(metric, name):
+    # True if the class of metric re-implements the method name of Base
+    return getattr(type(metric), name) != getattr(Base, name)
+
+
+_REDUCTIONS = {'sum': np.sum, 'max': np.max, 'min': np.min}
+
+
+def reduce_packed(ops, packed_states):
+    """ Reduce a list of packed states (see Base._pack) according to ops.
+    """
+    packed_states = np.stack(packed_states)
+    ops = np.asarray(ops)
+    reduced = np.empty(packed_states.shape[1])
+    for op, reduction in _REDUCTIONS.items():
+        mask = ops == op
+        if mask.any():
+            reduced[mask] = reduction(packed_states[:, mask], axis=0)
+    return reduced
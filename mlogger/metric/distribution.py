@@ -0,0 +1,344 @@
+import bisect
+import math
+
+import numpy as np
+
+from ..registry import register
+from .base import Base
+from .to_float import to_float, to_array
+
+
+@register
+class Histogram(Base):
+    def __init__(self, n_bins, low, high, log=False, time_indexing=None, plotter=None, plot_title=None,
+                 plot_legend=None):
+        """ Weighted counts of values in n_bins bins between low and high,
+        evenly spaced (or log-spaced if log is True). Values out of [low, high]
+        are counted in .underflow and .overflow. The value of the metric is
+        the array of counts per bin, which cannot be plotted against time: a
+        Histogram does not accept a plotter.
+        """
+        assert n_bins >= 1 and high > low
+        assert not log or low > 0, "log bins require low > 0"
+        assert plotter is None, "a Histogram cannot be plotted"
+        self._n_bins = n_bins
+        self._low = low
+        self._high = high
+        self._log_bins = log
+        if log:
+            self._edges = np.geomspace(low, high, n_bins + 1)
+        else:
+            self._edges = np.linspace(low, high, n_bins + 1)
+        # for single updates (bisect on a list is faster than numpy on a scalar)
+        self._edges_list = self._edges.tolist()
+        super(Histogram, self).__init__(time_indexing, plotter, plot_title, plot_legend)
+
+    def reset(self):
+        # underflow, bins, overflow
+        self._counts = np.zeros(self._n_bins + 2)
+        self._reset_sink()
+        return self
+
+    def _update(self, val, weighting=1):
+        val = to_float(val)
+        weighting = to_float(weighting)
+        assert weighting > 0
+
+        # same bins as _update_batch
+        if val != val:
+            return
+        if val == self._high:
+            index = self._n_bins
+        else:
+            index = bisect.bisect_right(self._edges_list, val)
+        self._counts[index] += weighting
+
+    def _update_batch(self, values, weights=None):
+        values = to_array(values)
+        if weights is not None:
+            weights = np.broadcast_to(to_array(weights), values.shape)
+            assert np.all(weights > 0)
+
+        # NaNs are not counted
+        valid = ~np.isnan(values)
+        if not np.all(valid):
+            values = values[valid]
+            weights = weights[valid] if weights is not None else None
+
+        # 0 for underflow, n_bins + 1 for overflow, high is in the last bin
+        indices = np.searchsorted(self._edges, values, side='right')
+        indices[values == self._high] = self._n_bins
+        self._counts += np.bincount(indices, weights, minlength=self._n_bins + 2)
+
+    def plot_on(self, plotter, plot_title, plot_legend=None):
+        raise TypeError("a Histogram cannot be plotted")
+
+    def merge(self, other):
+        assert np.array_equal(self._edges, other._edges), "cannot merge histograms with different bins"
+        return super(Histogram, self).merge(other)
+
+    def _reduce_ops(self):
+        return ('sum',) * len(self._counts)
+
+    def _pack(self):
+        self._sync()
+        return self._counts.copy()
+
+    def _unpack(self, packed):
+        self._counts = np.array(packed, dtype=np.float64)
+
+    @property
+    def edges(self):
+        return self._edges.copy()
+
+    @property
+    def underflow(self):
+        self._sync()
+        return self._counts[0]
+
+    @property
+    def overflow(self):
+        self._sync()
+        return self._counts[-1]
+
+    @property
+    def count(self):
+        self._sync()
+        return self._counts.sum()
+
+    @property
+    def value(self):
+        self._sync()
+        return self._counts[1:-1].copy()
+
+    def state_dict_extra(self, state):
+        self._sync()
+        state['counts'] = self._counts.tolist()
+
+    def load_state_dict_extra(self, state):
+        self._counts = np.array(state['counts'], dtype=np.float64)
+
+    def _init_args(self):
+        return {'n_bins': self._n_bins, 'low': self._low, 'high': self._high, 'log': self._log_bins,
+                'time_indexing': self._time_indexing}
+
+    def __repr__(self):
+        repr_ = "Histogram({n_bins}, {low}, {high}, {log}, {time_indexing}, {plotter}, '{plot_title}', '{plot_legend}')"
+        repr_ = repr_.format(n_bins=self._n_bins,
+                             low=self._low,
+                             high=self._high,
+                             log=self._log_bins,
+                             time_indexing=self._time_indexing,
+                             plotter=None,
+                             plot_title=self._plot_title,
+                             plot_legend=self._plot_legend)
+        return repr_
+
+
+class _LogStore(object):
+    """ Weighted counts of positive values in logarithmic bins: bin i holds
+    the values in (gamma^(i-1), gamma^i]. At most max_bins bins are kept,
+    the lowest bins are collapsed when needed.
+    """
+    def __init__(self, max_bins):
+        self.max_bins = max_bins
+        self.offset = 0
+        self.counts = np.zeros(0)
+
+    def add(self, indices, weights):
+        if not len(indices):
+            return
+        low, high = indices.min(), indices.max()
+        self._extend(low, high)
+        counts = np.bincount(indices - self.offset, weights, minlength=len(self.counts))
+        self.counts += counts
+        self._collapse()
+
+    def add_one(self, index, weight):
+        if not len(self.counts) or not self.offset <= index < self.offset + len(self.counts):
+            self._extend(index, index)
+        self.counts[index - self.offset] += weight
+        self._collapse()
+
+    def _extend(self, low, high):
+        if not len(self.counts):
+            self.offset = low
+            self.counts = np.zeros(high - low + 1)
+            return
+        new_offset = min(low, self.offset)
+        new_end = max(high + 1, self.offset + len(self.counts))
+        if new_offset < self.offset or new_end > self.offset + len(self.counts):
+            counts = np.zeros(new_end - new_offset)
+            counts[self.offset - new_offset:self.offset - new_offset + len(self.counts)] = self.counts
+            self.offset, self.counts = new_offset, counts
+
+    def _collapse(self):
+        # merge the lowest bins so that at most max_bins bins are used
+        excess = len(self.counts) - self.max_bins
+        if excess > 0:
+            self.counts[excess] += self.counts[:excess].sum()
+            self.counts = self.counts[excess:].copy()
+            self.offset += excess
+
+    def merge(self, other):
+        if len(other.counts):
+            self._extend(other.offset, other.offset + len(other.counts) - 1)
+            start = other.offset - self.offset
+            self.counts[start:start + len(other.counts)] += other.counts
+            self._collapse()
+
+    @property
+    def total(self):
+        return self.counts.sum()
+
+    def state_dict(self):
+        return {'offset': int(self.offset), 'counts': self.counts.tolist()}
+
+    def load_state_dict(self, state):
+        self.offset = state['offset']
+        self.counts = np.array(state['counts'], dtype=np.float64)
+
+
+@register
+class Quantile(Base):
+    def __init__(self, q=0.5, relative_accuracy=0.01, max_bins=2048, time_indexing=None, plotter=None,
+                 plot_title=None, plot_legend=None):
+        """ Streaming estimate of the q-quantile of the values, with constant
+        memory. Values are counted in logarithmic bins (as in DDSketch), so that
+        the estimated quantiles have a relative error of at most
+        relative_accuracy, as long as at most max_bins bins are needed.
+        Other quantiles can be obtained with .quantile(q).
+        """
+        assert 0 <= q <= 1 and 0 < relative_accuracy < 1
+        self._q = q
+        self._relative_accuracy = relative_accuracy
+        self._max_bins = max_bins
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        super(Quantile, self).__init__(time_indexing, plotter, plot_title, plot_legend)
+
+    def reset(self):
+        self._positive = _LogStore(self._max_bins)
+        self._negative = _LogStore(self._max_bins)
+        self._zero_count = 0.
+        # infinite values are counted apart from the bins, like zeros
+        self._inf_counts = np.zeros(2)
+        return self
+
+    def _update(self, val, weighting=1):
+        val = to_float(val)
+        weighting = to_float(weighting)
+        assert weighting > 0
+
+        # same bins as _update_batch
+        if val != val:
+            return
+        if val == math.inf or val == -math.inf:
+            self._inf_counts[int(val > 0)] += weighting
+        elif val > 0:
+            self._positive.add_one(int(math.ceil(math.log(val) / self._log_gamma)), weighting)
+        elif val < 0:
+            self._negative.add_one(int(math.ceil(math.log(-val) / self._log_gamma)), weighting)
+        else:
+            self._zero_count += weighting
+
+    def _update_batch(self, values, weights=None):
+        values = to_array(values)
+        if weights is None:
+            weights = np.ones_like(values)
+        else:
+            weights = np.broadcast_to(to_array(weights), values.shape)
+            assert np.all(weights > 0)
+
+        # NaNs are not counted
+        valid = ~np.isnan(values)
+        values, weights = values[valid], weights[valid]
+
+        infinite = np.isinf(values)
+        if infinite.any():
+            self._inf_counts += [weights[values == -np.inf].sum(), weights[values == np.inf].sum()]
+            values, weights = values[~infinite], weights[~infinite]
+
+        positive, negative = values > 0, values < 0
+        self._positive.add(self._index(values[positive]), weights[positive])
+        self._negative.add(self._index(-values[negative]), weights[negative])
+        self._zero_count += weights[~(positive | negative)].sum()
+
+    def _index(self, values):
+        return np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+
+    def _bin_value(self, index):
+        # value with the smallest relative error in the bin
+        return 2 * self._gamma ** index / (self._gamma + 1)
+
+    def merge(self, other):
+        # the bins used may differ: no element-wise merge
+        assert type(other) is type(self)
+        assert self._relative_accuracy == other._relative_accuracy, \
+            "cannot merge quantiles with different relative accuracies"
+        self._positive.merge(other._positive)
+        self._negative.merge(other._negative)
+        self._zero_count += other._zero_count
+        self._inf_counts += other._inf_counts
+        return self
+
+    @property
+    def count(self):
+        return self._negative.total + self._zero_count + self._positive.total + self._inf_counts.sum()
+
+    def quantile(self, q):
+        """ Estimate of the q-quantile(s) of the values (q can be an array).
+        """
+        count = self.count
+        if not count:
+            return np.nan * np.asarray(q)
+
+        # representative values of all non-empty regions, in increasing order
+        negative, positive = self._negative, self._positive
+        values = [[-np.inf], -self._bin_value(negative.offset + np.arange(len(negative.counts)))[::-1]]
+        counts = [self._inf_counts[:1], negative.counts[::-1]]
+        if self._zero_count:
+            values.append(np.zeros(1))
+            counts.append(np.array([self._zero_count]))
+        values.append(self._bin_value(positive.offset + np.arange(len(positive.counts))))
+        counts.append(positive.counts)
+        values.append([np.inf])
+        counts.append(self._inf_counts[1:])
+        values, counts = np.concatenate(values), np.concatenate(counts)
+        # empty regions cannot be selected
+        values, counts = values[counts > 0], counts[counts > 0]
+
+        indices = np.searchsorted(np.cumsum(counts), np.asarray(q) * count, side='left')
+        return values[np.minimum(indices, len(values) - 1)]
+
+    @property
+    def value(self):
+        return float(self.quantile(self._q))
+
+    def state_dict_extra(self, state):
+        state['positive'] = self._positive.state_dict()
+        state['negative'] = self._negative.state_dict()
+        state['zero_count'] = float(self._zero_count)
+        state['inf_counts'] = self._inf_counts.tolist()
+
+    def load_state_dict_extra(self, state):
+        self._positive.load_state_dict(state['positive'])
+        self._negative.load_state_dict(state['negative'])
+        self._zero_count = state['zero_count']
+        self._inf_counts = np.array(state.get('inf_counts', [0., 0.]), dtype=np.float64)
+
+    def _init_args(self):
+        return {'q': self._q, 'relative_accuracy': self._relative_accuracy, 'max_bins': self._max_bins,
+                'time_indexing': self._time_indexing}
+
+    def __repr__(self):
+        repr_ = ("Quantile({q}, {relative_accuracy}, {max_bins}, {time_indexing}, {plotter}, "
+                 "'{plot_title}', '{plot_legend}')")
+        repr_ = repr_.format(q=self._q,
+                             relative_accuracy=self._relative_accuracy,
+                             max_bins=self._max_bins,
+                             time_indexing=self._time_indexing,
+                             plotter=None,
+                             plot_title=self._plot_title,
+                             plot_legend=self._plot_legend)
+        return repr_
@@ -1,52 +1,290 @@
 import numpy as np
+import threading
 import time
 import mlogger
 
-from collections import defaultdict, OrderedDict
-from future.utils import viewitems
+
+# columns of the rollup buckets
+ROLLUP_FIELDS = ('start', 'end', 'count', 'mean', 'min', 'max')
+_START, _END, _COUNT, _MEAN, _MIN, _MAX = range(len(ROLLUP_FIELDS))
+
+
+class _NoLock(object):
+    # lock of the histories that are not thread-safe
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+
+_NO_LOCK = _NoLock()
+
+
+class Retention(object):
+    def __init__(self, raw=10000, bucket_size=100, max_buckets=100, factor=10):
+        """ Retention policy of a history, which bounds its memory:
+        * raw:
+            number of most recent points kept as logged
+        * bucket_size:
+            older points are summarized by buckets of bucket_size points
+            (start time, end time, count, mean, min and max of the non-NaN values)
+        * max_buckets:
+            maximal number of buckets per level of resolution: when a level
+            is full, its factor oldest buckets are merged in one bucket of the
+            next (coarser) level
+
+        The number of levels grows as the logarithm of the number of logged
+        points.
+        """
+        assert raw >= 1 and bucket_size >= 1 and max_buckets >= 1 and factor >= 2
+        self.raw = raw
+        self.bucket_size = bucket_size
+        self.max_buckets = max_buckets
+        self.factor = factor
+
+    def state_dict(self):
+        return {'raw': self.raw, 'bucket_size': self.bucket_size,
+                'max_buckets': self.max_buckets, 'factor': self.factor}
+
+    def __repr__(self):
+        repr_ = "Retention({raw}, {bucket_size}, {max_buckets}, {factor})"
+        return repr_.format(**self.state_dict())
 
 
 class History(object):
-    def __init__(self, time_indexing):
+    def __init__(self, time_indexing, capacity=16, retention=None):
+
+        # growable buffers: only the first self._n entries are valid
+        self._times_buffer = np.empty(capacity, dtype=np.float64)
+        self._values_buffer = np.empty(capacity, dtype=np.float64)
+        self._n = 0
+
+        # rollups of points evicted by the retention policy, finest level first
+        self._rollups = []
+        self._n_evicted = 0
 
-        self._times = []
-        self._values = []
+        # logs can come from several threads once the history is made
+        # thread-safe (see thread_safe), a no-op lock otherwise
+        self._lock = _NO_LOCK
+
+        # running statistics of all logged values (see _compute_stats),
+        # computed on first use and then updated by log
+        self._stats = None
+        # prefix sums of the values and counts of non-NaN values of the
+        # first self._n_prefix points, computed on first use
+        self._prefix_buffer = np.zeros((2, 1))
+        self._n_prefix = 0
 
         if time_indexing is None:
             time_indexing = mlogger._time_indexing
 
+        if retention is None:
+            retention = mlogger._retention
+
         self.time_indexing = time_indexing
+        self.retention = retention
 
         if self.time_indexing:
             self.start_time = time.time()
         else:
             self.start_time = 0
 
-    def time(self):
-        # elapsed time since start for time indexing
+    @property
+    def _times(self):
+        # zero-copy view on logged times
+        return self._times_buffer[:self._n]
+
+    @property
+    def _values(self):
+        # zero-copy view on logged values
+        return self._values_buffer[:self._n]
+
+    def __len__(self):
+        return self._n
+
+    def time(self, now=None):
+        # elapsed time since start for time indexing (now is the current
+        # wall-clock time, useful to log several histories at the same time)
         if self.time_indexing:
-            event_time = time.time() - self.start_time
+            if now is None:
+                now = time.time()
+            event_time = now - self.start_time
         # increment by one since last event for increment
-        elif len(self._times):
-            event_time = self._times[-1] + 1
+        elif self._n:
+            event_time = self._times_buffer.item(self._n - 1) + 1
         # start at 0 for increment
         else:
             event_time = 0
 
         return event_time
 
+    def _grow(self, min_capacity):
+        # amortized doubling of the buffers
+        capacity = max(2 * len(self._times_buffer), min_capacity, 16)
+
+        times = np.empty(capacity, dtype=np.float64)
+        times[:self._n] = self._times_buffer[:self._n]
+        values = np.empty(capacity, dtype=self._values_buffer.dtype)
+        values[:self._n] = self._values_buffer[:self._n]
+
+        self._times_buffer = times
+        self._values_buffer = values
+
+    def _to_object_values(self):
+        # fallback for metrics whose values are not scalars (e.g. TNT meters)
+        values = np.empty(len(self._values_buffer), dtype=object)
+        for i, value in enumerate(self._values_buffer[:self._n].tolist()):
+            values[i] = value
+        self._values_buffer = values
+        self._stats = None
+
     def log(self, event_time, value):
-        self._times.append(event_time)
-        self._values.append(value)
+        # the no-op lock is skipped, as it would be most of the cost of a log
+        if self._lock is _NO_LOCK:
+            self._append(event_time, value)
+        else:
+            with self._lock:
+                self._append(event_time, value)
+        return self
+
+    def _append(self, event_time, value):
+        n = self._n
+        if n == len(self._times_buffer):
+            self._grow(n + 1)
 
+        # Python floats (the values of most metrics) are stored as they are
+        if type(value) is not float and self._values_buffer.dtype != object:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                self._to_object_values()
+
+        self._times_buffer[n] = event_time
+        self._values_buffer[n] = value
+        self._n = n + 1
+
+        if self._stats is not None:
+            self._update_stats(event_time, value)
+
+        if self.retention is not None and self._n >= 2 * self.retention.raw:
+            self._evict()
+
+    def thread_safe(self, use=True):
+        """ Protect log and the lazily computed statistics with a lock if use
+        is True (see Base.thread_safe).
+        """
+        if use and self._lock is _NO_LOCK:
+            self._lock = threading.Lock()
+        elif not use:
+            self._lock = _NO_LOCK
         return self
 
-    def state_dict(self):
+    def __getstate__(self):
+        # locks cannot be pickled
+        state = self.__dict__.copy()
+        state['_lock'] = self._lock is not _NO_LOCK
+        return state
+
+    def __setstate__(self, state):
+        thread_safe = state.pop('_lock')
+        self.__dict__.update(state)
+        self._lock = _NO_LOCK
+        self.thread_safe(thread_safe)
+
+    def _evict(self):
+        # summarize the oldest points in buckets, keeping at least retention.raw raw points
+        bucket_size = self.retention.bucket_size
+        n_buckets = (self._n - self.retention.raw) // bucket_size
+        if not n_buckets or self._values_buffer.dtype == object:
+            return
+        n_evicted = n_buckets * bucket_size
+
+        # running statistics are exact only if computed before the eviction
+        if self._stats is None:
+            self._stats = self._compute_stats()
+
+        times = self._times_buffer[:n_evicted].reshape(n_buckets, bucket_size)
+        values = self._values_buffer[:n_evicted].reshape(n_buckets, bucket_size)
+        buckets = np.empty((n_buckets, len(ROLLUP_FIELDS)))
+        buckets[:, _START] = times[:, 0]
+        buckets[:, _END] = times[:, -1]
+        # NaN values (e.g. a diverged loss) are not counted
+        valid = ~np.isnan(values)
+        buckets[:, _COUNT] = valid.sum(axis=1)
+        buckets[:, _MEAN] = _mean(np.where(valid, values, 0.).sum(axis=1), buckets[:, _COUNT])
+        buckets[:, _MIN] = np.fmin.reduce(values, axis=1)
+        buckets[:, _MAX] = np.fmax.reduce(values, axis=1)
+        self._add_buckets(0, buckets)
+
+        # copy remaining points to new buffers, so that views on the previous
+        # buffers (e.g. data cached by a plotter) are not modified
+        n_kept = self._n - n_evicted
+        capacity = max(2 * n_kept, 16)
+        times = np.empty(capacity, dtype=np.float64)
+        times[:n_kept] = self._times_buffer[n_evicted:self._n]
+        values = np.empty(capacity, dtype=np.float64)
+        values[:n_kept] = self._values_buffer[n_evicted:self._n]
+        self._times_buffer, self._values_buffer = times, values
+        self._n = n_kept
+        self._n_evicted += n_evicted
+        self._n_prefix = 0
+
+    def _add_buckets(self, level, buckets):
+        if level == len(self._rollups):
+            self._rollups.append(buckets)
+        else:
+            self._rollups[level] = np.concatenate([self._rollups[level], buckets])
+
+        # merge the oldest buckets of a full level into the next level
+        factor = self.retention.factor
+        n_merged = len(self._rollups[level]) - self.retention.max_buckets
+        n_merged = -(-n_merged // factor) * factor
+        # at most the full groups of factor buckets of the level (when
+        # max_buckets < factor, a level can hold up to factor - 1 buckets)
+        n_merged = min(n_merged, len(self._rollups[level]) // factor * factor)
+        if n_merged > 0:
+            oldest = self._rollups[level][:n_merged].reshape(-1, factor, len(ROLLUP_FIELDS))
+            self._rollups[level] = self._rollups[level][n_merged:]
+            self._add_buckets(level + 1, _merge_buckets(oldest))
+
+    @property
+    def rollups(self):
+        """ Buckets summarizing the points evicted by the retention policy,
+        from the oldest (coarsest) to the most recent (finest), as an array
+        with columns ROLLUP_FIELDS.
+        """
+        if not self._rollups:
+            return np.empty((0, len(ROLLUP_FIELDS)))
+        return np.concatenate(self._rollups[::-1])
+
+    def series(self):
+        """ Times and values of the full run: the mean of each rollup bucket
+        (at the middle of the bucket) followed by the raw points.
+        """
+        if not self._rollups:
+            return self._times, self._values
+        rollups = self.rollups
+        times = np.concatenate([(rollups[:, _START] + rollups[:, _END]) / 2, self._times])
+        values = np.concatenate([rollups[:, _MEAN], self._values])
+        return times, values
+
+    def state_dict(self, data=True, arrays=False):
+        # arrays: if True, scalar times and values are returned as zero-copy
+        # float64 views on the buffers instead of lists (see save_npz)
         state = {}
         state['start_time'] = self.start_time
         state['time_indexing'] = self.time_indexing
-        state['times'] = list(self._times)
-        state['values'] = list(self._values)
+        if self.retention is not None:
+            state['retention'] = self.retention.state_dict()
+            state['rollups'] = [level.tolist() for level in self._rollups]
+            state['n_evicted'] = self._n_evicted
+        if data and arrays and self._values_buffer.dtype != object:
+            state['times'] = self._times
+            state['values'] = self._values
+        elif data:
+            state['times'] = self._times.tolist()
+            state['values'] = _values_list(self._values)
 
         return state
 
@@ -55,12 +293,221 @@ class History(object):
         self.time_indexing = state['time_indexing']
         self.start_time = state['start_time']
 
-        self._times = list(state['times'])
-        self._values = list(state['values'])
+        if 'retention' in state:
+            self.retention = Retention(**state['retention'])
+            self._rollups = [np.asarray(level, dtype=np.float64).reshape(-1, len(ROLLUP_FIELDS))
+                             for level in state['rollups']]
+            self._n_evicted = state['n_evicted']
+        else:
+            self._rollups = []
+            self._n_evicted = 0
+
+        # arrays are used without copy (they may be memory-mapped, in which case
+        # they are copied to memory on the first log)
+        self._times_buffer = np.asanyarray(state['times'], dtype=np.float64)
+        self._values_buffer = _values_array(state['values'])
+        self._n = len(self._times_buffer)
+        self._stats = None
+        self._n_prefix = 0
 
     @property
     def last_value(self):
-        if len(self._values):
-            return self._values[-1]
+        if self._n:
+            return self._values[-1:].tolist()[0]
         else:
             return None
+
+    # running statistics: cover all logged points (including the points
+    # summarized by the retention policy), NaN values are ignored
+
+    def _compute_stats(self):
+        # count, sum, min, time of min, max, time of max
+        stats = [0, 0., np.inf, None, -np.inf, None]
+        if self._values_buffer.dtype == object:
+            return stats
+
+        rollups = self.rollups
+        if len(rollups):
+            middle = (rollups[:, _START] + rollups[:, _END]) / 2
+            stats[0] = int(rollups[:, _COUNT].sum())
+            stats[1] = float(_total(rollups[:, _MEAN], rollups[:, _COUNT]).sum())
+            self._fold_stats(stats, middle, rollups[:, _MIN], rollups[:, _MAX])
+
+        values = self._values
+        valid = ~np.isnan(values)
+        stats[0] += int(valid.sum())
+        stats[1] += float(values[valid].sum())
+        self._fold_stats(stats, self._times, values, values)
+        return stats
+
+    @staticmethod
+    def _fold_stats(stats, times, lows, highs):
+        if not len(times) or np.all(np.isnan(lows)):
+            return
+        i, j = np.nanargmin(lows), np.nanargmax(highs)
+        if lows[i] < stats[2]:
+            stats[2], stats[3] = float(lows[i]), float(times[i])
+        if highs[j] > stats[4]:
+            stats[4], stats[5] = float(highs[j]), float(times[j])
+
+    def _update_stats(self, event_time, value):
+        stats = self._stats
+        if self._values_buffer.dtype == object or value != value:
+            return
+        stats[0] += 1
+        stats[1] += value
+        if value < stats[2]:
+            stats[2], stats[3] = value, event_time
+        if value > stats[4]:
+            stats[4], stats[5] = value, event_time
+
+    @property
+    def _running_stats(self):
+        if self._stats is None:
+            with self._lock:
+                self._stats = self._compute_stats()
+        return self._stats
+
+    @property
+    def count(self):
+        # number of logged (non-NaN) values
+        return self._running_stats[0]
+
+    @property
+    def min(self):
+        return self._running_stats[2] if self._running_stats[3] is not None else None
+
+    @property
+    def argmin(self):
+        # time of the minimal value
+        return self._running_stats[3]
+
+    @property
+    def max(self):
+        return self._running_stats[4] if self._running_stats[5] is not None else None
+
+    @property
+    def argmax(self):
+        # time of the maximal value
+        return self._running_stats[5]
+
+    # queries by time: times are assumed to be non-decreasing, and only the
+    # points that have not been summarized by the retention policy are used
+
+    def index(self, time, side='right'):
+        """ Number of points logged at a time lower than (side='left') or
+        lower or equal to (side='right') time, by bisection.
+        """
+        return int(np.searchsorted(self._times, time, side=side))
+
+    def at(self, time):
+        """ Last value logged at or before time (None if there is none).
+        """
+        i = self.index(time)
+        return self._values[i - 1:i].tolist()[0] if i else None
+
+    def _range(self, start, end):
+        i = self.index(start, side='left') if start is not None else 0
+        j = self.index(end) if end is not None else self._n
+        return i, max(i, j)
+
+    def between(self, start=None, end=None):
+        """ Times and values (zero-copy views) of the points logged between
+        start and end (included). None means no bound.
+        """
+        i, j = self._range(start, end)
+        return self._times[i:j], self._values[i:j]
+
+    def _update_prefix(self):
+        # extend the prefix sums to the points logged since the last call
+        with self._lock:
+            self._extend_prefix()
+
+    def _extend_prefix(self):
+        n, n_prefix = self._n, self._n_prefix
+        if n_prefix == n:
+            return
+        if self._prefix_buffer.shape[1] < n + 1:
+            buffer = np.zeros((2, max(2 * self._prefix_buffer.shape[1], n + 1)))
+            buffer[:, :n_prefix + 1] = self._prefix_buffer[:, :n_prefix + 1]
+            self._prefix_buffer = buffer
+        values = self._values[n_prefix:n]
+        valid = ~np.isnan(values)
+        prefix = self._prefix_buffer
+        prefix[0, n_prefix + 1:n + 1] = prefix[0, n_prefix] + np.cumsum(np.where(valid, values, 0.))
+        prefix[1, n_prefix + 1:n + 1] = prefix[1, n_prefix] + np.cumsum(valid)
+        self._n_prefix = n
+
+    def sum(self, start=None, end=None):
+        """ Sum of the values logged between start and end (included),
+        in O(log n) with prefix sums. Without bounds, sum of all logged values.
+        """
+        if start is None and end is None:
+            return self._running_stats[1]
+        assert self._values_buffer.dtype != object, "the values are not scalars"
+        self._update_prefix()
+        i, j = self._range(start, end)
+        return float(self._prefix_buffer[0, j] - self._prefix_buffer[0, i])
+
+    def mean(self, start=None, end=None):
+        """ Mean of the values logged between start and end (included),
+        in O(log n) with prefix sums. Without bounds, mean of all logged values.
+        """
+        if start is None and end is None:
+            count = self.count
+            return self._running_stats[1] / count if count else None
+        assert self._values_buffer.dtype != object, "the values are not scalars"
+        self._update_prefix()
+        i, j = self._range(start, end)
+        count = self._prefix_buffer[1, j] - self._prefix_buffer[1, i]
+        return float(self._prefix_buffer[0, j] - self._prefix_buffer[0, i]) / count if count else None
+
+
+def _values_array(values):
+    """ Convert a sequence of logged values to a float64 array if every
+    value is a scalar, and to an object array otherwise.
+    """
+    try:
+        array = np.asanyarray(values, dtype=np.float64)
+        if array.ndim == 1:
+            return array
+    except (TypeError, ValueError):
+        pass
+    array = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        array[i] = value
+    return array
+
+
+def _merge_buckets(buckets):
+    """ Merge buckets of shape (n, k, len(ROLLUP_FIELDS)) along the second
+    dimension.
+    """
+    counts = buckets[:, :, _COUNT]
+    merged = np.empty((buckets.shape[0], len(ROLLUP_FIELDS)))
+    merged[:, _START] = buckets[:, 0, _START]
+    merged[:, _END] = buckets[:, -1, _END]
+    merged[:, _COUNT] = counts.sum(axis=1)
+    merged[:, _MEAN] = _mean(_total(buckets[:, :, _MEAN], counts).sum(axis=1), merged[:, _COUNT])
+    merged[:, _MIN] = np.fmin.reduce(buckets[:, :, _MIN], axis=1)
+    merged[:, _MAX] = np.fmax.reduce(buckets[:, :, _MAX], axis=1)
+    return merged
+
+
+def _total(means, counts):
+    # sums of the values of buckets (0 for empty buckets, whose mean is NaN)
+    return np.where(counts > 0, means * counts, 0.)
+
+
+def _mean(totals, counts):
+    # means of buckets (NaN for empty buckets)
+    means = np.full(totals.shape, np.nan)
+    np.divide(totals, counts, out=means, where=counts > 0)
+    return means
+
+
+def _values_list(values):
+    # list of logged values, with array values (e.g. histograms) as lists
+    if values.dtype != object:
+        return values.tolist()
+    return [value.tolist() if isinstance(value, np.ndarray) else value for value in values]
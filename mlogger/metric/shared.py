@@ -0,0 +1,233 @@
+import multiprocessing
+import multiprocessing.util
+import os
+import time
+import warnings
+import numpy as np
+
+from .base import reduce_packed
+
+# optional shared memory (python >= 3.8)
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+# status of a slot
+_FREE, _ACTIVE, _RETIRED = range(3)
+
+# seconds after which a slot still being written is considered lost (its
+# writer died during a write)
+_READ_TIMEOUT = 1.
+
+
+class SharedSink(object):
+    def __init__(self, metric, n_slots=64, context=None):
+        """ Shared-memory state of a metric updated by several processes
+        (see Base.share).
+
+        Each process updating the metric claims a slot of a shared memory
+        block, in which it writes the packed state (see Base._pack) of its own
+        copy of the metric after each update. Slots have a single writer and
+        are protected by a sequence lock, so that updates never wait on each
+        other nor on the reader (the lock of the sink is only taken when a
+        process claims a slot). The process that created the sink reads the
+        metric by reducing all the slots. When a process exits, its slot is
+        merged into a slot reserved for exited processes, and can be claimed
+        again.
+
+        The sink can be passed to processes when they are created (e.g. as
+        an argument of multiprocessing.Process, or as an attribute of the
+        dataset of a DataLoader), and is updated with .update and .update_batch.
+        context is the multiprocessing start method of these processes
+        (default start method if None).
+        """
+        assert shared_memory is not None, "multiprocessing.shared_memory could not be imported"
+        assert metric.packable, "{} cannot be shared".format(type(metric).__name__)
+
+        self._template = metric._clone()
+        self._ops = self._template._reduce_ops()
+        self._n_slots = n_slots
+        self._width = len(self._ops)
+        self._lock = multiprocessing.get_context(context).Lock()
+        self._owner_pid = os.getpid()
+
+        # generation, then status and sequence number of each slot (int64),
+        # then (generation, packed state) of each slot (float64). An extra
+        # slot holds the merged states of the processes that have exited.
+        size = 8 * (1 + 2 * (n_slots + 1) + (n_slots + 1) * (1 + self._width))
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._attach()
+        self._generation[0] = 0
+        self._status[:] = _FREE
+        self._seqs[:] = 0
+        self._data[-1] = np.nan
+
+        # the creator writes in a slot like any other process, starting
+        # from the current state of metric
+        self._claim()
+        self._shard._unpack(metric._pack())
+        self._write(self._shard_generation, self._shard._pack())
+
+    def _attach(self):
+        buf = self._shm.buf
+        n_rows, width = self._n_slots + 1, self._width
+        self._generation = np.ndarray((1,), dtype=np.int64, buffer=buf)
+        self._status = np.ndarray((n_rows - 1,), dtype=np.int64, buffer=buf, offset=8)
+        self._seqs = np.ndarray((n_rows,), dtype=np.int64, buffer=buf, offset=8 * n_rows)
+        self._data = np.ndarray((n_rows, 1 + width), dtype=np.float64, buffer=buf,
+                                offset=8 * (1 + 2 * n_rows))
+        # slot of the current process, claimed on its first update
+        self._pid = None
+        self._slot = None
+        self._shard = None
+        # sequence number of the slots lost by the reader
+        self._lost = {}
+
+    def __getstate__(self):
+        return {'name': self._shm.name, 'n_slots': self._n_slots, 'ops': self._ops,
+                'lock': self._lock, 'template': self._template, 'owner_pid': self._owner_pid}
+
+    def __setstate__(self, state):
+        self._shm = shared_memory.SharedMemory(name=state['name'])
+        self._n_slots = state['n_slots']
+        self._ops = state['ops']
+        self._width = len(self._ops)
+        self._lock = state['lock']
+        self._template = state['template']
+        self._owner_pid = state['owner_pid']
+        self._attach()
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def _claim(self):
+        with self._lock:
+            self._fold_retired()
+            free = np.flatnonzero(self._status == _FREE)
+            if not len(free):
+                raise RuntimeError("all the {} slots of the shared metric are in use".format(self._n_slots))
+            slot = int(free[0])
+            # a slot lost during a write is left odd
+            if self._seqs[slot] % 2:
+                self._seqs[slot] += 1
+            self._pid = os.getpid()
+            self._slot = slot
+            self._shard = self._template._clone()
+            self._shard_generation = int(self._generation[0])
+            self._write(self._shard_generation, self._shard._pack())
+            self._status[slot] = _ACTIVE
+
+        # release the slot when the process exits (processes created by
+        # multiprocessing exit without calling atexit functions)
+        if self._pid != self._owner_pid:
+            multiprocessing.util.Finalize(self, self._retire, exitpriority=10)
+
+    def _retire(self):
+        if self._pid == os.getpid():
+            self._status[self._slot] = _RETIRED
+
+    def _write(self, generation, packed, slot=None):
+        # sequence lock: odd while the slot is being written (each slot has
+        # a single writer, the extra slot is only written with the lock held)
+        slot = self._slot if slot is None else slot
+        self._seqs[slot] += 1
+        self._data[slot, 0] = generation
+        self._data[slot, 1:] = packed
+        self._seqs[slot] += 1
+
+    def _read(self, slot):
+        # None if the writer of the slot died during a write: the slot stays
+        # odd, and is skipped without waiting until it is claimed again
+        deadline = None
+        while True:
+            seq = self._seqs[slot]
+            if not seq % 2:
+                row = self._data[slot].copy()
+                if self._seqs[slot] == seq:
+                    return row
+            elif self._lost.get(slot) == seq:
+                return None
+            elif deadline is None or seq != odd_seq:
+                deadline, odd_seq = time.time() + _READ_TIMEOUT, seq
+            elif time.time() > deadline:
+                self._lost[slot] = seq
+                warnings.warn("slot {} of the shared metric has been written for more than {} seconds, its "
+                              "state is ignored".format(slot, _READ_TIMEOUT))
+                return None
+            time.sleep(0)
+
+    def _prepare(self):
+        # claim a slot in new processes (including forked ones, which inherit
+        # the slot of their parent), and start over after a reset
+        if self._pid != os.getpid():
+            self._claim()
+        generation = int(self._generation[0])
+        if generation != self._shard_generation:
+            self._shard.reset()
+            self._shard_generation = generation
+
+    def update(self, *args, **kwargs):
+        self._prepare()
+        self._shard._update(*args, **kwargs)
+        self._write(self._shard_generation, self._shard._pack())
+
+    def update_batch(self, values, weights=None):
+        self._prepare()
+        self._shard._update_batch(values, weights)
+        self._write(self._shard_generation, self._shard._pack())
+
+    def _fold_retired(self):
+        # merge the slots of the processes that have exited into the extra
+        # slot, and free them (with the lock held)
+        generation = int(self._generation[0])
+        retired = self._data[-1]
+        states = [retired[1:]] if retired[0] == generation else []
+        slots = np.flatnonzero(self._status == _RETIRED)
+        if not len(slots):
+            return
+        for slot in slots:
+            row = self._read(slot)
+            if row is not None and row[0] == generation:
+                states.append(row[1:])
+        if states:
+            self._write(generation, reduce_packed(self._ops, states), slot=-1)
+        self._status[slots] = _FREE
+
+    def read(self):
+        """ Packed state of the metric, reduced over all processes.
+        """
+        assert os.getpid() == self._owner_pid, "a shared metric can only be read by the process that created it"
+        generation = int(self._generation[0])
+
+        # the lock is only taken by the reader and by processes claiming a slot
+        with self._lock:
+            self._fold_retired()
+            slots = list(np.flatnonzero(self._status == _ACTIVE)) + [-1]
+            rows = [self._read(slot) for slot in slots]
+            states = [row[1:] for row in rows if row is not None and row[0] == generation]
+        if not states:
+            return self._template._pack()
+        return reduce_packed(self._ops, states)
+
+    def clear(self):
+        """ Reset the state of the metric in all processes: each process
+        starts over at its next update.
+        """
+        assert os.getpid() == self._owner_pid, "a shared metric can only be reset by the process that created it"
+        with self._lock:
+            self._generation[0] += 1
+        self._prepare()
+        self._write(self._shard_generation, self._shard._pack())
+
+    def close(self, unlink=False):
+        """ Release the shared memory in the current process, and destroy
+        it if unlink is True.
+        """
+        # views on the buffer must be deleted before closing it
+        del self._generation, self._status, self._seqs, self._data
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
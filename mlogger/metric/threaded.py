@@ -0,0 +1,80 @@
+import threading
+
+from .base import reduce_packed
+
+
+class _Shard(object):
+    # copy of the metric updated by one thread
+    def __init__(self, metric):
+        self.metric = metric
+        self.lock = threading.Lock()
+        self.thread = threading.current_thread()
+
+
+class ThreadShards(object):
+    def __init__(self, metric):
+        """ Per-thread state of a metric updated by several threads (see
+        Base.thread_safe).
+
+        Each thread updates its own copy of the metric, protected by its own
+        lock, which is only contended when the metric is read: threads never
+        wait on each other. Reading the metric reduces the packed states (see
+        Base._pack) of all copies. The copies of threads that have exited are
+        merged into a base state.
+        """
+        assert metric.packable, "{} cannot be made thread-safe".format(type(metric).__name__)
+        self._template = metric._clone()
+        self._ops = self._template._reduce_ops()
+        self._base = metric._pack()
+        self._shards = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = _Shard(self._template._clone())
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def update(self, *args, **kwargs):
+        shard = self._shard()
+        with shard.lock:
+            shard.metric._update(*args, **kwargs)
+
+    def update_batch(self, values, weights=None):
+        shard = self._shard()
+        with shard.lock:
+            shard.metric._update_batch(values, weights)
+
+    def read(self):
+        """ Packed state of the metric, reduced over all threads.
+        """
+        with self._lock:
+            states = []
+            alive = []
+            for shard in self._shards:
+                with shard.lock:
+                    packed = shard.metric._pack()
+                if shard.thread.is_alive():
+                    alive.append(shard)
+                    states.append(packed)
+                else:
+                    # a thread that has exited cannot update its copy anymore
+                    self._base = reduce_packed(self._ops, [self._base, packed])
+            self._shards = alive
+            return reduce_packed(self._ops, [self._base] + states)
+
+    def clear(self):
+        """ Reset the state of the metric in all threads.
+        """
+        with self._lock:
+            self._base = self._template._clone()._pack()
+            for shard in self._shards:
+                with shard.lock:
+                    shard.metric.reset()
+
+    def close(self, unlink=False):
+        pass
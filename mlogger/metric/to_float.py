@@ -1,11 +1,20 @@
+import sys
 import numpy as np
 
-try:
-    import torch
-    import torch.autograd as torch_autograd
-except ImportError:
-    torch = None
-    torch_autograd = None
+from .. import profiler
+
+
+def _torch():
+    # pytorch is never imported by mlogger: values can only be tensors if
+    # it has already been imported
+    return sys.modules.get('torch')
+
+
+def is_tensor(val):
+    """ Check whether val is a pytorch autograd Variable or tensor
+    """
+    torch = _torch()
+    return torch is not None and (torch.is_tensor(val) or isinstance(val, torch.autograd.Variable))
 
 
 def to_float(val):
@@ -16,16 +25,68 @@ def to_float(val):
     - any type supporting float() operation
     And convert val to float
     """
+    if profiler.enabled:
+        return profiler.call(profiler._current, 'to_float', _to_float, val)
+    return _to_float(val)
 
-    n_elements = 1
-    if isinstance(val, np.ndarray):
-        n_elements = val.size
-    elif torch is not None and (isinstance(val, torch_autograd.Variable) or torch.is_tensor(val)):
-        n_elements = torch.numel(val)
 
+def _to_float(val):
+    # this is called on every update: dispatch on the exact type of val
+    converter = _converters.get(type(val))
+    if converter is None:
+        converter = _converters[type(val)] = _find_converter(val)
+    return converter(val)
+
+
+def _array_to_float(val):
+    assert val.size == 1, \
+        "val should have one element (got {})".format(val.size)
+    return float(val.item())
+
+
+def _tensor_to_float(val):
+    n_elements = val.numel()
     assert n_elements == 1, \
         "val should have one element (got {})".format(n_elements)
+    return float(val)
+
+
+def _generic_to_float(val):
     try:
         return float(val)
     except:
         raise TypeError("Unsupported type for val ({})".format(type(val)))
+
+
+def _find_converter(val):
+    if isinstance(val, np.ndarray):
+        return _array_to_float
+    elif isinstance(val, (np.number, np.bool_)):
+        return float
+    elif is_tensor(val):
+        return _tensor_to_float
+    else:
+        return _generic_to_float
+
+
+# converter to use for each type of val, filled on first use of each type
+_converters = {float: float, int: float, bool: float}
+
+
+def to_array(val):
+    """ Convert val to a flat numpy array of floats, where val is one of:
+    - pytorch autograd Variable or tensor
+    - numpy array
+    - any sequence of numbers
+    """
+    if is_tensor(val):
+        val = val.detach().cpu().numpy()
+    return np.asarray(val, dtype=np.float64).ravel()
+
+
+def to_tensor(val):
+    """ Detach val (pytorch autograd Variable or tensor) from the graph and
+    flatten it to a float64 tensor on the same device, without synchronizing
+    the device.
+    """
+    return val.detach().reshape(-1).to(_torch().float64)
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+def decimate(x, y, n_out, method='minmax'):
+    """ Reduce the series (x, y) to at most n_out points for plotting.
+    * method:
+        - 'minmax': keep the minimum and the maximum of each bucket of points
+        - 'lttb': largest-triangle-three-buckets, keeps one point per bucket
+    The first and last points are always kept.
+    """
+    if method == 'minmax':
+        return minmax(x, y, n_out)
+    elif method == 'lttb':
+        return lttb(x, y, n_out)
+    else:
+        raise ValueError("Unknown decimation method '{}'".format(method))
+
+
+def minmax(x, y, n_out):
+    n = len(x)
+    if n <= n_out or n_out < 4:
+        return x, y
+
+    # two points per bucket, the first and last points are kept apart
+    n_buckets = (n_out - 2) // 2
+    edges = np.linspace(1, n - 1, n_buckets + 1).astype(int)
+    starts = edges[:-1]
+    bucket = np.repeat(np.arange(n_buckets), np.diff(edges))
+    inner = y[1:n - 1]
+
+    # fmin and fmax ignore NaNs
+    mins = np.fmin.reduceat(inner, starts - 1)
+    maxs = np.fmax.reduceat(inner, starts - 1)
+
+    indices = [0, n - 1]
+    for extrema in (mins, maxs):
+        hits = np.flatnonzero(inner == extrema[bucket])
+        # first hit in each bucket
+        _, first = np.unique(bucket[hits], return_index=True)
+        indices.append(hits[first] + 1)
+
+    indices = np.unique(np.concatenate([np.atleast_1d(i) for i in indices]))
+    return x[indices], y[indices]
+
+
+def lttb(x, y, n_out):
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return x, y
+
+    # one point per bucket, the first and last points are kept apart
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+
+    indices = np.empty(n_out, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    previous = 0
+
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+
+        # average of the next bucket (or last point)
+        if i + 2 < len(edges):
+            next_x = x[end:edges[i + 2]].mean()
+            next_y = y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+
+        # point of the bucket forming the largest triangle
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.nanargmax(areas)) if not np.all(np.isnan(areas)) else start
+        indices[i + 1] = previous
+
+    return x[indices], y[indices]
@@ -2,6 +2,8 @@ from collections import defaultdict
 
 import numpy as np
 
+from .decimation import decimate
+
 
 class GraphWindow(object):
     def __init__(self, plotter, title, opts=None):
@@ -21,10 +23,8 @@ class GraphWindow(object):
             self._visdom_window = window
 
     def update(self, legend, x, y):
-        cache = self.caches[legend]
-        cache.update(x, y)
-        if not self.plotter.manual_update:
-            self.update_plot()
+        # cache data, the plotter decides when to send it
+        self.caches[legend].update(x, y)
 
     def update_plot(self):
         # window not yet created on visdom
@@ -40,9 +40,16 @@ class GraphWindow(object):
             if cache.is_empty:
                 continue
 
+            x, y = cache.x_array, cache.y_array
+
+            # bound the number of points sent per legend
+            max_points = self.plotter.max_points
+            if max_points is not None and len(x) > max_points:
+                x, y = decimate(x, y, max_points, self.plotter.decimation)
+
             # plot data
             plotted = self.plotter.viz.line(
-                Y=cache.y_array, X=cache.x_array,
+                Y=y, X=x,
                 name=legend, win=self._visdom_window,
                 update='append')
 
@@ -66,12 +73,18 @@ class XYCache(object):
     def clear(self):
         self._x = []
         self._y = []
+        self._has_arrays = False
 
     def update(self, x, y):
+        # x and y are either scalars or arrays (e.g. a full history)
         self._x.append(x)
         self._y.append(y)
+        if isinstance(x, np.ndarray):
+            self._has_arrays = True
 
     def array(self, u):
+        if self._has_arrays:
+            return np.concatenate([np.ravel(v) for v in u])
         u = np.asarray(u)
         u = np.squeeze(u)
         if u.ndim == 0:
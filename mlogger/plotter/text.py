@@ -18,9 +18,8 @@ class TextWindow(object):
             self._visdom_window = window
 
     def update(self, data_dict):
+        # cache data, the plotter decides when to send it
         self.cache.update(data_dict)
-        if not self.plotter.manual_update:
-            self.update_plot()
 
     def update_plot(self):
         # window not yet created on visdom
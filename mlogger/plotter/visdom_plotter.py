@@ -1,63 +1,269 @@
-from collections import defaultdict
+import queue
+import threading
+import time
+import warnings
+import numpy as np
+
+from collections import defaultdict, deque, OrderedDict
 
 from .graph import GraphWindow
 from .text import TextWindow
 
-# optional visdom
-try:
-    import visdom
-except ImportError:
-    visdom = None
+# optional visdom, imported on first use (see _import_visdom)
+visdom = None
+
+
+def _import_visdom():
+    global visdom
+    if visdom is None:
+        try:
+            import visdom as visdom_module
+        except ImportError:
+            visdom_module = None
+        assert visdom_module is not None, "visdom could not be imported"
+        visdom = visdom_module
+    return visdom
 
 
 class VisdomPlotter(object):
-    def __init__(self, visdom_opts, manual_update=False):
+    def __init__(self, visdom_opts, manual_update=False, asynchronous=False,
+                 queue_size=10000, overflow='drop', max_points=None, decimation='minmax',
+                 flush_interval=None, flush_points=None):
         """
         * visdom_opts:
             options for visdom instance
-        * mode:
-            - if 'automatic', sends data to visdom as soon as data arrives
-            - if 'manual', sends data to visdom only when .update_plots() is called by user
+        * manual_update:
+            - if False, sends data to visdom as soon as data arrives
+            - if True, sends data to visdom only when .update_plots() is called by user
+        * asynchronous:
+            if True, data is put in a bounded queue and sent to visdom by a
+            background thread, so that logging never waits on the network.
+            All the points pending for a window and legend are sent in one request.
+        * queue_size:
+            maximal number of pending updates in asynchronous mode
+        * overflow:
+            what to do with an update when the queue is full in asynchronous mode:
+            - 'drop': discard it (the number of discarded updates is in .n_dropped)
+            - 'spill': keep it in an unbounded overflow buffer
+        * max_points:
+            if not None, maximal number of points sent per window and legend in
+            one request (e.g. when a long history is plotted with plot_on)
+        * decimation:
+            how to reduce the data to max_points:
+            - 'minmax': minimum and maximum per bucket of points, keeps spikes visible
+            - 'lttb': largest-triangle-three-buckets
+        * flush_interval, flush_points:
+            flush policy when manual_update is False. If either is not None, data
+            is cached and all cached data is sent at the first update after
+            flush_interval seconds have elapsed since the last send, or when
+            flush_points points are pending. If both are None, data is sent on
+            every update.
         """
         super(VisdomPlotter, self).__init__()
 
+        assert overflow in ('drop', 'spill'), \
+            "overflow should be 'drop' or 'spill' (got {})".format(overflow)
+        assert decimation in ('minmax', 'lttb'), \
+            "decimation should be 'minmax' or 'lttb' (got {})".format(decimation)
+
         self.manual_update = manual_update
         self.visdom_opts = visdom_opts
+        self.asynchronous = asynchronous
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.max_points = max_points
+        self.decimation = decimation
+        self.flush_interval = flush_interval
+        self.flush_points = flush_points
+        self._n_pending = 0
+        self._last_flush = time.time()
 
         if self.visdom_opts is None:
             self.visdom_opts = {}
 
-        assert visdom is not None, "visdom could not be imported"
-
-        self.viz = visdom.Visdom(**self.visdom_opts)
+        self.viz = _import_visdom().Visdom(**self.visdom_opts)
         self.graph_wins = {}
         self.text_wins = {}
         self.win_opts = defaultdict(dict)
 
+        if self.asynchronous:
+            self.n_dropped = 0
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._spill = deque()
+            self._worker = threading.Thread(target=self._run_worker)
+            self._worker.daemon = True
+            self._worker.start()
+
     def set_win_opts(self, title, opts):
         if 'title' in opts:
             del opts['title']
         self.win_opts[title] = opts
 
-    def _update_xy(self, title, legend, x, y):
+    def _graph_win(self, title):
         if title not in self.graph_wins:
             self.graph_wins[title] = GraphWindow(
                 plotter=self, title=title,
                 opts=self.win_opts[title])
-        self.graph_wins[title].update(legend, x, y)
+        return self.graph_wins[title]
 
-    def _update_text(self, title, data_dict):
+    def _text_win(self, title):
         if title not in self.text_wins:
             self.text_wins[title] = TextWindow(plotter=self, title=title)
-        self.text_wins[title].update(data_dict)
+        return self.text_wins[title]
 
-    def update_plots(self):
-        for graph_win in self.graph_wins.values():
+    def _update_xy(self, title, legend, x, y):
+        if self.asynchronous:
+            self._put(('xy', title, legend, x, y))
+            return
+
+        graph_win = self._graph_win(title)
+        graph_win.update(legend, x, y)
+        self._after_update([graph_win], np.size(x))
+
+    def _update_xy_group(self, title, points):
+        # points: list of (legend, x, y) to add to the same window
+        if self.asynchronous:
+            self._put(('xy_group', title, points))
+            return
+
+        graph_win = self._graph_win(title)
+        for legend, x, y in points:
+            graph_win.update(legend, x, y)
+        self._after_update([graph_win], sum(np.size(x) for _, x, _ in points))
+
+    def _update_text(self, title, data_dict):
+        if self.asynchronous:
+            self._put(('text', title, data_dict.copy()))
+            return
+
+        text_win = self._text_win(title)
+        text_win.update(data_dict)
+        self._after_update([text_win], 1)
+
+    def _after_update(self, updated_wins, n_points):
+        if self.manual_update:
+            return
+
+        if self.flush_interval is None and self.flush_points is None:
+            for win in updated_wins:
+                win.update_plot()
+            return
+
+        # flush policy
+        self._n_pending += n_points
+        if not self._n_pending:
+            return
+        if (self.flush_points is not None and self._n_pending >= self.flush_points) or \
+                (self.flush_interval is not None and time.time() - self._last_flush >= self.flush_interval):
+            self._update_all_plots()
+
+    def _update_all_plots(self):
+        self._n_pending = 0
+        self._last_flush = time.time()
+
+        for graph_win in list(self.graph_wins.values()):
             graph_win.update_plot()
 
-        for text_win in self.text_wins.values():
+        for text_win in list(self.text_wins.values()):
             text_win.update_plot()
 
+    def update_plots(self):
+        if self.asynchronous:
+            self._put(('flush', None))
+            return
+
+        self._update_all_plots()
+
+    def wait(self, timeout=None):
+        """ In asynchronous mode, block until all updates made so far have
+        been sent to visdom (or until timeout seconds have elapsed).
+        Returns False if the timeout has expired.
+        """
+        if not self.asynchronous:
+            return True
+        done = threading.Event()
+        self._queue.put(('flush', done))
+        return done.wait(timeout)
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # flush requests are never dropped
+            if self.overflow == 'spill' or item[0] == 'flush':
+                self._spill.append(item)
+            else:
+                self.n_dropped += 1
+
+    def _run_worker(self):
+        while True:
+            try:
+                # wake up regularly for updates spilled while the worker was busy
+                items = [self._queue.get(timeout=1.)]
+            except queue.Empty:
+                items = []
+            n_queued = len(items)
+
+            # coalesce everything that is pending
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                    n_queued += 1
+                except queue.Empty:
+                    break
+            while self._spill:
+                items.append(self._spill.popleft())
+
+            try:
+                self._process(items)
+            except Exception as e:
+                warnings.warn("VisdomPlotter failed to send data: {}".format(e))
+
+            for _ in range(n_queued):
+                self._queue.task_done()
+
+    def _process(self, items):
+        done_events = [item[1] for item in items if item[0] == 'flush' and item[1] is not None]
+        try:
+            self._send(items)
+        finally:
+            for done in done_events:
+                done.set()
+
+    def _send(self, items):
+        updated_wins = OrderedDict()
+        flush = False
+        n_points = 0
+
+        for item in items:
+            if item[0] == 'xy':
+                _, title, legend, x, y = item
+                graph_win = self._graph_win(title)
+                graph_win.update(legend, x, y)
+                updated_wins[id(graph_win)] = graph_win
+                n_points += np.size(x)
+            elif item[0] == 'xy_group':
+                _, title, points = item
+                graph_win = self._graph_win(title)
+                for legend, x, y in points:
+                    graph_win.update(legend, x, y)
+                    n_points += np.size(x)
+                updated_wins[id(graph_win)] = graph_win
+            elif item[0] == 'text':
+                _, title, data_dict = item
+                text_win = self._text_win(title)
+                text_win.update(data_dict)
+                updated_wins[id(text_win)] = text_win
+                n_points += 1
+            elif item[0] == 'flush':
+                flush = True
+
+        if flush:
+            self._update_all_plots()
+        else:
+            # one request per updated window and legend
+            self._after_update(updated_wins.values(), n_points)
+
     def state_dict(self):
         state = {}
         state['repr'] = repr(self)
@@ -80,5 +286,11 @@ class VisdomPlotter(object):
             self.text_wins[title].load_state_dict(text_win_state)
 
     def __repr__(self):
-        repr_ = "VisdomPlotter({visdom_opts}, {manual_update})".format(visdom_opts=self.visdom_opts, manual_update=self.manual_update)
+        repr_ = ("VisdomPlotter({visdom_opts}, {manual_update}, {asynchronous}, {queue_size}, "
+                 "'{overflow}', {max_points}, '{decimation}', {flush_interval}, {flush_points})").format(
+            visdom_opts=self.visdom_opts, manual_update=self.manual_update,
+            asynchronous=self.asynchronous, queue_size=self.queue_size,
+            overflow=self.overflow, max_points=self.max_points,
+            decimation=self.decimation, flush_interval=self.flush_interval,
+            flush_points=self.flush_points)
         return repr_
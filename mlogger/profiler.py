@@ -0,0 +1,100 @@
+""" Opt-in profiling of the overhead of mlogger.
+
+When enabled (mlogger.profiler.enable()), the number of calls and the
+cumulative wall time of the hot paths are recorded per metric (or per
+container): update and update_batch, to_float, hooks, History.log, plotter
+calls and save_to. Reports are made with Container.profile_report().
+
+Instrumented calls go through call (or call_hooks): when profiling is
+disabled (the default), it only checks the module attribute `enabled`.
+"""
+import time
+import weakref
+
+from collections import defaultdict
+
+enabled = False
+
+clock = getattr(time, 'perf_counter', time.time)
+
+# object (metric or container) -> section -> [number of calls, seconds]
+_records = weakref.WeakKeyDictionary()
+
+# calls made outside of any metric update (e.g. to_float called by user code)
+_unattributed = defaultdict(lambda: [0, 0.])
+
+# metric being updated, to which nested calls (to_float) are attributed
+_current = None
+
+
+def enable(use=True):
+    """ Start (use=True) or stop (use=False) recording.
+    """
+    global enabled
+    assert use is True or use is False
+    enabled = use
+
+
+def reset():
+    """ Clear all the recorded statistics.
+    """
+    _records.clear()
+    _unattributed.clear()
+
+
+def record(obj, section, seconds):
+    if obj is None:
+        entry = _unattributed[section]
+    else:
+        if obj not in _records:
+            _records[obj] = defaultdict(lambda: [0, 0.])
+        entry = _records[obj][section]
+    entry[0] += 1
+    entry[1] += seconds
+
+
+def call(obj, section, function, *args, **kwargs):
+    # function(*args, **kwargs), recording its time in section if profiling is enabled
+    if not enabled:
+        return function(*args, **kwargs)
+    start = clock()
+    result = function(*args, **kwargs)
+    record(obj, section, clock() - start)
+    return result
+
+
+def call_hooks(obj, section, hooks):
+    # call hooks, recording their time in section if profiling is enabled
+    call(obj, section, _call_all, hooks)
+
+
+def _call_all(hooks):
+    for hook in hooks:
+        hook()
+
+
+def stats(obj):
+    """ Dict section -> (number of calls, seconds) recorded for obj.
+    """
+    if obj not in _records:
+        return {}
+    return dict((section, tuple(entry)) for section, entry in _records[obj].items())
+
+
+def report(named_objects):
+    """ Table of the statistics of the (name, object) pairs of
+    named_objects, sorted by decreasing cumulative time.
+    """
+    rows = []
+    for name, obj in named_objects:
+        for section, (count, seconds) in stats(obj).items():
+            rows.append((name, section, count, seconds))
+    for section, (count, seconds) in _unattributed.items():
+        rows.append(('(other)', section, count, seconds))
+    rows.sort(key=lambda row: -row[3])
+
+    lines = ["{:<30} {:<20} {:>10} {:>12} {:>12}".format("name", "section", "calls", "total (ms)", "per call (us)")]
+    for name, section, count, seconds in rows:
+        lines.append("{:<30} {:<20} {:>10} {:>12.3f} {:>12.3f}".format(
+            name, section, count, 1e3 * seconds, 1e6 * seconds / count))
+    return "\n".join(lines)
@@ -0,0 +1,77 @@
+""" Types of the objects stored in a container (metrics, Config and
+Container), by name, used to rebuild them when a container is loaded.
+
+The state dict of each object stores its type name ('__type__') and the
+arguments of its constructor ('__args__', a dict of keyword arguments, see
+Base._init_args), so loading an object is a dictionary lookup followed by a
+constructor call. States saved before types were recorded only have a 'repr'
+string such as "Average(None, None, 'title', 'legend')": it is parsed with
+ast and its arguments must be Python literals (no code is executed).
+
+Custom metrics register themselves with:
+
+    @mlogger.register
+    class MyMetric(mlogger.metric.Base):
+        ...
+"""
+import ast
+
+# type name -> class, and class -> type name
+_types = {}
+_names = {}
+
+
+def register(cls=None, name=None):
+    """ Register cls under name (its class name by default), so that
+    containers saved with objects of type cls can be loaded. Can be used as
+    a class decorator, with or without arguments.
+    """
+    if cls is None:
+        return lambda cls: register(cls, name)
+    if name is None:
+        name = cls.__name__
+    if name in _types and _types[name] is not cls:
+        raise ValueError("type name '{}' is already registered for {}".format(name, _types[name]))
+    _types[name] = cls
+    _names[cls] = name
+    return cls
+
+
+def get(name):
+    """ Registered type with the given name.
+    """
+    try:
+        return _types[name]
+    except KeyError:
+        raise ValueError("unknown type '{}': register it with mlogger.register".format(name))
+
+
+def name_of(cls):
+    """ Name under which cls is registered (None if it is not).
+    """
+    return _names.get(cls)
+
+
+def construct(state):
+    """ New object of the type recorded in state (not loaded with state).
+    """
+    if '__type__' in state:
+        return get(state['__type__'])(**state.get('__args__', {}))
+
+    # state saved without its type
+    name, args, kwargs = _parse_repr(state['repr'])
+    return get(name)(*args, **kwargs)
+
+
+def _parse_repr(repr_):
+    # type name, positional and keyword arguments of a constructor call
+    try:
+        call = ast.parse(repr_, mode='eval').body
+        if not isinstance(call, ast.Call) or not isinstance(call.func, ast.Name):
+            raise ValueError("not a constructor call")
+        args = [ast.literal_eval(arg) for arg in call.args]
+        kwargs = dict((keyword.arg, ast.literal_eval(keyword.value)) for keyword in call.keywords
+                      if keyword.arg is not None)
+    except (SyntaxError, ValueError) as e:
+        raise ValueError("cannot rebuild an object from '{}' ({})".format(repr_, e))
+    return call.func.id, args, kwargs
@@ -0,0 +1,358 @@
+import json
+import os
+import struct
+import zipfile
+import numpy as np
+import mlogger
+
+
+FORMATS = ('json', 'npz', 'journal')
+
+EXTENSIONS = {'.json': 'json', '.npz': 'npz', '.jsonl': 'journal'}
+
+# key of the JSON manifest inside a .npz archive
+_MANIFEST_KEY = '__manifest__'
+
+
+def infer_format(filename, format=None):
+    """ Return the serialization format to use for filename:
+    - format if it is given explicitly
+    - 'npz' for files with a .npz extension
+    - 'journal' for files with a .jsonl extension
+    - 'json' otherwise
+    """
+    if format is None:
+        extension = os.path.splitext(filename)[1].lower()
+        format = EXTENSIONS.get(extension, 'json')
+
+    if format not in FORMATS:
+        raise ValueError("Unknown format '{}' (expected one of {})".format(format, FORMATS))
+
+    return format
+
+
+def save_state(state_dict, filename, format=None):
+    format = infer_format(filename, format)
+    if format == 'json':
+        with open(filename, "w") as f:
+            json.dump(state_dict, f)
+    elif format == 'npz':
+        save_npz(state_dict, filename)
+    elif format == 'journal':
+        with open(filename, "w") as f:
+            Journal.write_record(f, {'snapshot': state_dict})
+
+
+def load_state(filename, format=None, lazy=False):
+    format = infer_format(filename, format)
+    if lazy and format != 'npz':
+        raise ValueError("lazy loading requires the 'npz' format (got '{}')".format(format))
+
+    if format == 'json':
+        with open(filename, "r") as f:
+            return json.load(f)
+    elif format == 'npz':
+        return load_npz(filename, mmap=lazy)
+    elif format == 'journal':
+        return Journal.replay(filename)
+
+
+def _split_histories(state, prefix, arrays):
+    """ Replace the times and values of every history found in state by
+    references to float64 arrays stored in arrays. Returns the manifest,
+    i.e. state without the history data.
+    """
+    manifest = {}
+    for key, value in state.items():
+        if _is_history(key, value):
+            value = _split_history(value, prefix + key, arrays)
+        elif isinstance(value, dict) and 'repr' in value:
+            value = _split_histories(value, prefix + key + '/', arrays)
+        manifest[key] = value
+    return manifest
+
+
+def _is_history(key, value):
+    # history of a metric, and not a child of a container named 'history'
+    # (whose state has a repr)
+    return key == 'history' and isinstance(value, dict) and 'repr' not in value
+
+
+def _split_history(history, name, arrays):
+    try:
+        values = np.asarray(history['values'], dtype=np.float64)
+    except (TypeError, ValueError):
+        values = None
+
+    # non-scalar histories are kept inline in the manifest
+    if values is None or values.ndim != 1:
+        return history
+
+    manifest = dict(history)
+    manifest['times'] = name + '/times'
+    manifest['values'] = name + '/values'
+    arrays[manifest['times']] = np.asarray(history['times'], dtype=np.float64)
+    arrays[manifest['values']] = values
+    return manifest
+
+
+def _join_histories(manifest, arrays):
+    for key, value in manifest.items():
+        if _is_history(key, value):
+            for field in ('times', 'values'):
+                if not isinstance(value[field], list):
+                    value[field] = arrays[value[field]]
+        elif isinstance(value, dict) and 'repr' in value:
+            _join_histories(value, arrays)
+    return manifest
+
+
+def save_npz(state_dict, filename):
+    """ Save state_dict as an uncompressed .npz archive with one float64
+    array per history and a JSON manifest for everything else.
+    """
+    arrays = {}
+    manifest = _split_histories(state_dict, '', arrays)
+    manifest = json.dumps(manifest).encode('utf-8')
+    arrays[_MANIFEST_KEY] = np.frombuffer(manifest, dtype=np.uint8)
+
+    # write to a temporary file and rename it, so that containers that
+    # memory-map a previous version of the file are not affected
+    tmp_filename = filename + '.tmp'
+    # use a file object so that numpy does not append an extension
+    with open(tmp_filename, "wb") as f:
+        np.savez(f, **arrays)
+    _replace(tmp_filename, filename)
+
+
+def load_npz(filename, mmap=False):
+    """ Load a state dict saved with save_npz. If mmap is True, the
+    histories are memory-mapped read-only from filename instead of being
+    read in memory, which makes loading independent of history lengths.
+    """
+    with np.load(filename) as archive:
+        manifest = json.loads(archive[_MANIFEST_KEY].tobytes().decode('utf-8'))
+        if not mmap:
+            return _join_histories(manifest, archive)
+
+    with zipfile.ZipFile(filename) as archive:
+        arrays = _MemmapArchive(filename, archive)
+        return _join_histories(manifest, arrays)
+
+
+class _MemmapArchive(object):
+    """ Memory-map the .npy members of an uncompressed .npz archive.
+    """
+    def __init__(self, filename, archive):
+        self.filename = filename
+        self.archive = archive
+
+    def __getitem__(self, key):
+        info = self.archive.getinfo(key + '.npy')
+        assert info.compress_type == zipfile.ZIP_STORED, \
+            "cannot memory-map compressed member {}".format(key)
+
+        with open(self.filename, "rb") as f:
+            # skip the local file header of the member
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_length, extra_length = struct.unpack('<HH', header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            offset = f.tell()
+
+        if not shape[0]:
+            return np.empty(shape, dtype=dtype)
+
+        return np.memmap(self.filename, dtype=dtype, mode='r', shape=shape,
+                         offset=offset, order='F' if fortran_order else 'C')
+
+
+def _replace(src, dst):
+    # atomic rename, overwriting dst
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        os.rename(src, dst)
+
+
+class Journal(object):
+    """ Append-only journal of the state of a container.
+
+    The first save writes a snapshot of the full state. Each following save
+    appends one update record containing, for every metric, only the points
+    logged since the previous save and its scalar state if it has changed.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        # path -> (object, number of saved history points, number of points evicted
+        #          from the history at the time of the save, JSON of its scalar state)
+        self._saved = {}
+
+    @staticmethod
+    def write_record(f, record):
+        f.write(json.dumps(record))
+        f.write("\n")
+
+    def save(self, container):
+        # (re-)start the journal with a snapshot
+        if not self._saved or not os.path.exists(self.filename):
+            self._saved = {}
+            state_dict = container.state_dict()
+            self._track(container, '', state_dict)
+            with open(self.filename, "w") as f:
+                self.write_record(f, {'snapshot': state_dict})
+            return
+
+        update = {}
+        seen = set()
+        self._diff(container, '', update, seen)
+
+        # objects that are no longer in the container
+        fresh = [path for path, entry in update.items() if 'state' in entry]
+        deleted = [path for path in self._saved
+                   if path not in seen and not any(_is_under(path, p) for p in fresh)]
+        for path in deleted:
+            del self._saved[path]
+            if not any(_is_under(path, p) for p in deleted):
+                update[path] = {'delete': True}
+
+        with open(self.filename, "a") as f:
+            self.write_record(f, {'update': update})
+
+    def _track(self, obj, path, state):
+        if isinstance(obj, mlogger.Container):
+            self._saved[path] = (obj, 0, 0, None)
+            for key, child in obj.named_children():
+                self._track(child, _join(path, key), state[key])
+        elif isinstance(obj, mlogger.metric.Base):
+            history = obj._history
+            self._saved[path] = (obj, len(history), history._n_evicted, _scalar_state(state))
+        else:
+            self._saved[path] = (obj, 0, 0, _scalar_state(state))
+
+    def _diff(self, obj, path, update, seen):
+        seen.add(path)
+        saved = self._saved.get(path)
+
+        # new or replaced object: store its full state
+        if saved is None or saved[0] is not obj:
+            for key in [p for p in self._saved if _is_under(p, path)]:
+                del self._saved[key]
+            state = obj.state_dict()
+            self._track(obj, path, state)
+            update[path] = {'state': state}
+            return
+
+        if isinstance(obj, mlogger.Container):
+            for key, child in obj.named_children():
+                self._diff(child, _join(path, key), update, seen)
+            return
+
+        _, n_saved, n_evicted, scalar_state = saved
+        entry = {}
+
+        if isinstance(obj, mlogger.metric.Base):
+            history = obj._history
+            # history has been replaced by a shorter one, or points have been
+            # evicted by its retention policy: store everything
+            if len(history) < n_saved or history._n_evicted != n_evicted:
+                state = obj.state_dict()
+                self._track(obj, path, state)
+                update[path] = {'state': state}
+                return
+            if len(history) > n_saved:
+                entry['times'] = history._times[n_saved:].tolist()
+                entry['values'] = mlogger.metric.history._values_list(history._values[n_saved:])
+            n_saved = len(history)
+            state = obj.state_dict(history_data=False)
+        else:
+            state = obj.state_dict()
+
+        new_scalar_state = _scalar_state(state)
+        if new_scalar_state != scalar_state:
+            entry['scalars'] = state
+
+        self._saved[path] = (obj, n_saved, n_evicted, new_scalar_state)
+        if entry:
+            update[path] = entry
+
+    @staticmethod
+    def replay(filename):
+        """ Rebuild the full state dict stored in a journal file.
+        """
+        state_dict = None
+        with open(filename, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if 'snapshot' in record:
+                    state_dict = record['snapshot']
+                else:
+                    _apply_update(state_dict, record['update'])
+        return state_dict
+
+
+def compact_journal(filename):
+    """ Rewrite a journal file as a single snapshot.
+    """
+    state_dict = Journal.replay(filename)
+    with open(filename, "w") as f:
+        Journal.write_record(f, {'snapshot': state_dict})
+
+
+def _join(path, key):
+    return key if not path else path + '.' + key
+
+
+def _is_under(path, parent):
+    # strict descendant of parent
+    return path != parent and (parent == '' or path.startswith(parent + '.'))
+
+
+def _scalar_state(state):
+    # state without history data, as canonical JSON for cheap comparisons
+    if 'history' in state:
+        state = dict(state)
+        state['history'] = dict((key, value) for key, value in state['history'].items()
+                                if key not in ('times', 'values'))
+    return json.dumps(state, sort_keys=True)
+
+
+def _apply_update(state_dict, update):
+    # apply parents before children
+    for path in sorted(update, key=lambda p: (p.count('.'), p)):
+        entry = update[path]
+        keys = path.split('.') if path else []
+        parent = state_dict
+        for key in keys[:-1]:
+            parent = parent[key]
+
+        if 'delete' in entry:
+            parent.pop(keys[-1], None)
+            continue
+
+        if 'state' in entry:
+            if keys:
+                parent[keys[-1]] = entry['state']
+            else:
+                state_dict.clear()
+                state_dict.update(entry['state'])
+            continue
+
+        state = parent[keys[-1]] if keys else state_dict
+        if 'scalars' in entry:
+            scalars = dict(entry['scalars'])
+            history = scalars.pop('history', None)
+            state.update(scalars)
+            if history is not None:
+                state['history'].update(history)
+        if 'times' in entry:
+            state['history']['times'].extend(entry['times'])
+            state['history']['values'].extend(entry['values'])
@@ -1,12 +1,54 @@
+import atexit
+import gzip
+import os
+import shutil
 import sys
+import threading
 
 
 class WriteOut_(object):
-    def __init__(self, filename, enabled=True):
+    def __init__(self, filename, enabled=True, buffered=False, buffer_size=65536, flush_interval=1.,
+                 max_bytes=None, backup_count=5, compress=False, stderr=False):
+        """ Copy everything printed to the console to filename.
+        * buffered:
+            if True, printed text is kept in memory and written to the file
+            by a background thread, every flush_interval seconds or as soon
+            as buffer_size characters are pending, so that printing never
+            waits on the file system (including print(..., flush=True))
+        * max_bytes:
+            if not None, the file is rotated when it would exceed max_bytes
+            (counted as characters): filename is renamed to filename.1,
+            filename.1 to filename.2, etc., keeping backup_count previous files
+        * compress:
+            if True, rotated files are compressed with gzip (filename.1.gz, ...)
+        * stderr:
+            if True, text written to sys.stderr (e.g. tracebacks and warnings)
+            is also copied to filename
+        """
         self.terminal = sys.stdout
+        self.filename = filename
         self.enabled = enabled
+        self.buffered = buffered
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+        self.stderr = stderr
+        self._stderr = None
+        self._started = False
+
         if self.enabled:
             self.log = open(filename, 'a')
+            self._size = self.log.tell()
+            self._lock = threading.Lock()
+
+        if self.enabled and self.buffered:
+            self._pending = []
+            self._n_pending = 0
+            self._wake = threading.Event()
+            self._stopping = False
+            self._writer = None
 
     def __enter__(self):
         self.start()
@@ -14,26 +56,131 @@ class WriteOut_(object):
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.stop()
 
+    def __getattr__(self, key):
+        # behave like the console for everything else (encoding, isatty...)
+        return getattr(self.__dict__['terminal'], key)
+
     def start(self):
-        if self.enabled:
-            sys.stdout = self
+        if not self.enabled:
+            return
+        self._started = True
+        sys.stdout = self
+        if self.stderr:
+            self._stderr = _Tee(sys.stderr, self._append)
+            sys.stderr = self._stderr
+        if self.buffered:
+            self._writer = threading.Thread(target=self._run_writer)
+            self._writer.daemon = True
+            self._writer.start()
+            # the writer is a daemon thread: write what is pending at exit
+            atexit.register(self.stop)
 
     def stop(self):
+        if not self._started:
+            return
+        self._started = False
         sys.stdout = self.terminal
+        if self._stderr is not None:
+            sys.stderr = self._stderr.stream
+            self._stderr = None
         if self.enabled:
-            self.log.close()
+            if self.buffered:
+                atexit.unregister(self.stop)
+                self._stopping = True
+                self._wake.set()
+                self._writer.join()
+            with self._lock:
+                self.log.close()
 
     def write(self, message):
         self.terminal.write(message)
         if self.enabled:
-            self.log.write(message)
+            self._append(message)
+
+    def _append(self, message):
+        # copy message to the file
+        if not self.buffered:
+            with self._lock:
+                self._write(message)
+            return
+        with self._lock:
+            self._pending.append(message)
+            self._n_pending += len(message)
+            if self._n_pending >= self.buffer_size:
+                self._wake.set()
+
+    def _run_writer(self):
+        # in buffered mode, only this thread uses the file: the lock only
+        # protects the pending text, so that printing never waits on the
+        # file system (nor on the compression of a rotated file)
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            stopping = self._stopping
+            with self._lock:
+                pending, self._pending, self._n_pending = self._pending, [], 0
+            if pending:
+                self._write(''.join(pending))
+                self.log.flush()
+            if stopping:
+                return
+
+    def _write(self, text):
+        # with the lock held, or from the writer thread in buffered mode
+        if self.max_bytes is not None and self._size and self._size + len(text) > self.max_bytes:
+            self._rotate()
+        self.log.write(text)
+        self._size += len(text)
+
+    def _rotate(self):
+        self.log.close()
+        extension = '.gz' if self.compress else ''
+
+        def backup(i):
+            return '{}.{}{}'.format(self.filename, i, extension)
+
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                if os.path.exists(backup(i)):
+                    os.rename(backup(i), backup(i + 1))
+            if self.compress:
+                with open(self.filename, 'rb') as f_in, gzip.open(backup(1), 'wb') as f_out:
+                    shutil.copyfileobj(f_in, f_out)
+            else:
+                os.rename(self.filename, backup(1))
+
+        self.log = open(self.filename, 'w')
+        self._size = 0
 
     def flush(self):
-        #this flush method is needed for python 3 compatibility.
-        #this handles the flush command by doing nothing.
-        #you might want to specify some extra behavior here.
-        pass
+        self.terminal.flush()
+        # in buffered mode, the file is written by the background thread
+        if self.enabled and not self.buffered:
+            with self._lock:
+                self.log.flush()
+
+
+class _Tee(object):
+    # stream that also passes what is written to append
+    def __init__(self, stream, append):
+        self.stream = stream
+        self.append = append
+
+    def write(self, message):
+        self.stream.write(message)
+        self.append(message)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, key):
+        return getattr(self.__dict__['stream'], key)
 
 
-def stdout_to(filename, enabled=True):
-    return WriteOut_(filename, enabled)
+def stdout_to(filename, enabled=True, buffered=False, buffer_size=65536, flush_interval=1.,
+              max_bytes=None, backup_count=5, compress=False, stderr=False):
+    """ Context manager copying everything printed to the console to
+    filename (see WriteOut_ for the options).
+    """
+    return WriteOut_(filename, enabled, buffered, buffer_size, flush_interval,
+                     max_bytes, backup_count, compress, stderr)
@@ -9,6 +9,7 @@ setup(name='mlogger',
       license="MIT License",
       url='https://github.com/oval-group/mlogger',
       version=str(__version__),
+      python_requires=">=3.5",
       install_requires=["GitPython",
                         "numpy",
                         "future"])
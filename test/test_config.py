@@ -1,4 +1,8 @@
 import unittest
+import warnings
+import os
+import shutil
+import tempfile
 import mlogger
 
 
@@ -44,3 +48,95 @@ class TestConfig(unittest.TestCase):
         new_config.load_state_dict(state)
 
         self.assertDictEqual(new_config.state_dict(), self.config.state_dict())
+
+
+class TextPlotter(object):
+    def __init__(self):
+        self.texts = {}
+
+    def _update_text(self, title, data_dict):
+        self.texts.setdefault(title, {}).update(data_dict)
+
+
+try:
+    import git
+except ImportError:
+    git = None
+
+
+@unittest.skipIf(git is None, "GitPython is not installed")
+class TestGitInfo(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        self.repo_dir = os.path.join(self.directory, 'repo')
+        repo = git.Repo.init(self.repo_dir)
+        filename = os.path.join(self.repo_dir, 'file.txt')
+        with open(filename, 'w') as f:
+            f.write('a\n')
+        repo.index.add(['file.txt'])
+        repo.index.commit('first commit', author=git.Actor('a', 'a@a'), committer=git.Actor('a', 'a@a'))
+        with open(filename, 'w') as f:
+            f.write('b\n' * 1000)
+        self.git_hash = repo.head.object.hexsha
+        os.chdir(self.repo_dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def test_inline(self):
+        config = mlogger.Config(get_general_info=False, get_git_info=True)
+        assert config.git_hash == self.git_hash
+        assert '+b' in config.git_diff
+
+    def test_side_file(self):
+        diff_dir = os.path.join(self.directory, 'diffs')
+        config = mlogger.Config(get_general_info=False)
+        config.update_git_info(background=True, diff_dir=diff_dir, max_diff_size=100)
+
+        # field read: waits for the background thread
+        assert config.git_hash == self.git_hash
+        assert config.git_diff_truncated
+        assert 'git_diff' not in config.state_dict()['_state']
+        assert os.path.dirname(config.git_diff_file) == diff_dir
+        diff = config.read_git_diff()
+        assert len(diff) == 100 and diff.startswith('diff --git')
+
+        # cached: same diff and side file
+        other = mlogger.Config(get_general_info=False).update_git_info(diff_dir=diff_dir, max_diff_size=100)
+        assert other.git_diff_file == config.git_diff_file
+        assert os.listdir(diff_dir) == [os.path.basename(config.git_diff_file)]
+
+    def test_relative_side_file(self):
+        config = mlogger.Config(get_general_info=False).update_git_info(diff_dir='diffs')
+        assert config.git_diff_file == os.path.join(self.repo_dir, 'diffs', os.path.basename(config.git_diff_file))
+        os.chdir(self.directory)
+        assert '+b' in config.read_git_diff()
+
+    def test_side_file_error(self):
+        # a file in place of the directory of the side file
+        diff_dir = os.path.join(self.directory, 'not_a_directory')
+        open(diff_dir, 'w').close()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            config = mlogger.Config(get_general_info=False).update_git_info(diff_dir=diff_dir)
+        assert len(caught) == 1
+        assert config.git_hash == self.git_hash and '+b' in config.read_git_diff()
+
+    def test_state_dict_does_not_wait(self):
+        config = mlogger.Config(get_general_info=False, get_git_info=True, git_background=True)
+        config.state_dict()
+        assert config.wait_git_info(timeout=10)
+        assert config.state_dict()['_state']['git_hash'] == self.git_hash
+
+    def test_background_plotter(self):
+        plotter = TextPlotter()
+        config = mlogger.Config(plotter=plotter, plot_title='config', get_general_info=False, get_git_info=True,
+                                git_background=True, git_diff_dir=self.directory, git_max_diff_size=100)
+        # sent to the plotter when the thread finishes, without reading a field
+        config._git_pending.join(10)
+        assert plotter.texts['config']['git_hash'] == self.git_hash
+        assert plotter.texts['config']['git_diff_truncated']
+        assert os.path.dirname(plotter.texts['config']['git_diff_file']) == self.directory
@@ -1,8 +1,35 @@
 import unittest
+import threading
 import os
+import json
+import numpy as np
 import mlogger
 
 
+@mlogger.register(name='test_container.Scaled')
+class Scaled(mlogger.metric.Average):
+    """ Average of the values multiplied by scale, to test the registration of custom metrics.
+    """
+    def __init__(self, scale, time_indexing=None, plotter=None, plot_title=None, plot_legend=None):
+        self._scale = scale
+        super(Scaled, self).__init__(time_indexing, plotter, plot_title, plot_legend)
+
+    def _update(self, val, weighting=1):
+        super(Scaled, self)._update(self._scale * val, weighting)
+
+    def _init_args(self):
+        return {'scale': self._scale, 'time_indexing': self._time_indexing}
+
+    def __repr__(self):
+        return "Scaled({}, {})".format(self._scale, self._time_indexing)
+
+
+def without_types(state):
+    # state as saved before the types were recorded
+    return dict((key, without_types(value) if isinstance(value, dict) else value)
+                for key, value in state.items() if key not in ('__type__', '__args__'))
+
+
 class TestContainer(unittest.TestCase):
 
     def setUp(self):
@@ -126,3 +153,291 @@ class TestContainer(unittest.TestCase):
             self.assertDictEqual(old.state_dict(), new.state_dict())
 
         os.remove(tmp)
+
+    def test_load_registered_types(self):
+        self.C.a = self.metric_a
+        self.C.conf = self.config
+        self.C.CC = self.CC
+        self.C.CC.CCC = self.CCC
+        self.C.CC.e = mlogger.metric.Histogram(4, 0, 1)
+        self.C.CC.f = mlogger.metric.EMA(0.5)
+        self.C.s = Scaled(3)
+        self.C.s.update(2)
+        self.C.s.log()
+
+        state = self.C.state_dict()
+        assert state['__type__'] == 'Container' and state['CC']['f']['__args__']['decay'] == 0.5
+        assert state['s']['__type__'] == 'test_container.Scaled'
+
+        tmp = 'tmp.json'
+        self.C.save_to(tmp)
+        new_C = mlogger.load_container(tmp)
+        os.remove(tmp)
+        self.assertDictEqual(self.C.state_dict(), new_C.state_dict())
+        assert isinstance(new_C.s, Scaled) and new_C.s._scale == 3 and new_C.s.value == 6
+        assert isinstance(new_C.CC.e, mlogger.metric.Histogram) and new_C.CC.e._n_bins == 4
+
+        # the general information of the config is not collected again
+        self.assertDictEqual(new_C.conf._state, self.config._state)
+
+        state['s']['__type__'] = 'Unknown'
+        with self.assertRaises(ValueError):
+            mlogger.Container().load_state_dict(state)
+
+    def test_reserved_keys(self):
+        # keys of the state dict that cannot be the names of children
+        for key in ('repr', '__type__', '__args__'):
+            with self.assertRaises(ValueError):
+                setattr(self.C, key, mlogger.metric.Simple())
+
+        self.C.type = mlogger.metric.Simple()
+        self.C.args = mlogger.Container(c=mlogger.metric.Sum())
+        self.C.type.update(1)
+        new_C = mlogger.Container()
+        new_C.load_state_dict(self.C.state_dict())
+        self.assertDictEqual(new_C.state_dict(), self.C.state_dict())
+        assert isinstance(new_C.args, mlogger.Container) and new_C.type.value == 1
+
+    def test_load_without_types(self):
+        self.C.a = self.metric_a
+        self.C.conf = self.config
+        self.C.CC = self.CC
+        self.C.CC.e = mlogger.metric.Quantile(0.9)
+        self.metric_a.update(10)
+        self.CC.b.update(12)
+
+        state = without_types(self.C.state_dict())
+        new_C = mlogger.Container()
+        new_C.load_state_dict(state)
+        self.assertDictEqual(self.C.state_dict(), new_C.state_dict())
+        assert new_C.CC.e._q == 0.9
+
+        # the repr is parsed, not evaluated
+        state['a']['repr'] = "Simple(__import__('os').getcwd())"
+        with self.assertRaises(ValueError):
+            mlogger.Container().load_state_dict(state)
+
+    def test_save_and_load_npz(self):
+        self.C.a = self.metric_a
+        self.C.conf = self.config
+        self.C.CC = self.CC
+        self.C.CC.CCC = self.CCC
+
+        for value in range(10):
+            self.metric_a.update(value).log()
+            self.CC.b.update(value).log()
+        self.CCC.d.update(12).log()
+
+        tmp = 'tmp.npz'
+        self.C.save_to(tmp)
+        new_C = mlogger.load_container(tmp)
+
+        self.assertDictEqual(self.C.state_dict(), new_C.state_dict())
+        assert new_C.CC.b._history._values.dtype == np.float64
+
+        # histories are saved from their buffers, without copy
+        state = self.C.state_dict(history_arrays=True)
+        assert np.shares_memory(state['CC']['b']['history']['values'], self.CC.b._history._values_buffer)
+
+        # explicit format takes precedence over the extension
+        tmp_bin = 'tmp.bin'
+        self.C.save_to(tmp_bin, format='npz')
+        new_C = mlogger.load_container(tmp_bin, format='npz')
+        self.assertDictEqual(self.C.state_dict(), new_C.state_dict())
+
+        os.remove(tmp)
+        os.remove(tmp_bin)
+
+    def test_npz_child_named_history(self):
+        self.C.history = mlogger.metric.Simple()
+        self.C.CC = mlogger.Container(history=mlogger.Container(history=mlogger.metric.Average()))
+        self.C.history.update(1).log()
+        self.C.CC.history.history.update(2).log()
+
+        tmp = 'tmp.npz'
+        self.C.save_to(tmp)
+        for lazy in (False, True):
+            new_C = mlogger.load_container(tmp, lazy=lazy)
+            self.assertDictEqual(self.C.state_dict(), new_C.state_dict())
+        os.remove(tmp)
+
+    def test_save_and_load_journal(self):
+        self.C.a = self.metric_a
+        self.C.conf = self.config
+        self.C.CC = self.CC
+        self.C.h = mlogger.metric.Histogram(3, 0, 3)
+
+        tmp = 'tmp.jsonl'
+        for step in range(5):
+            self.metric_a.update(step).log()
+            self.CC.b.update(step).log()
+            # array values
+            self.C.h.update(step).log()
+            self.C.save_to(tmp)
+
+            new_C = mlogger.load_container(tmp)
+            self.assertDictEqual(self.C.state_dict(), new_C.state_dict())
+
+        # one snapshot followed by one update per save
+        with open(tmp) as f:
+            lines = f.readlines()
+        assert len(lines) == 5
+
+        # each update only contains the new points
+        update = json.loads(lines[-1])['update']
+        assert update['a']['times'] == [4.]
+        assert update['CC.b']['values'] == [2.]
+
+        # structural changes
+        self.C.CC.CCC = self.CCC
+        self.CCC.d.update(3)
+        del self.C.conf
+        self.C.save_to(tmp)
+        new_C = mlogger.load_container(tmp)
+        self.assertDictEqual(self.C.state_dict(), new_C.state_dict())
+
+        mlogger.serialization.compact_journal(tmp)
+        with open(tmp) as f:
+            assert len(f.readlines()) == 1
+        new_C = mlogger.load_container(tmp)
+        self.assertDictEqual(self.C.state_dict(), new_C.state_dict())
+
+        os.remove(tmp)
+
+    def test_lazy_load(self):
+        self.C.a = self.metric_a
+        self.C.conf = self.config
+        self.C.CC = self.CC
+
+        for value in range(10):
+            self.metric_a.update(value).log()
+            self.CC.b.update(value).log()
+
+        tmp = 'tmp.npz'
+        self.C.save_to(tmp)
+        new_C = mlogger.load_container(tmp, lazy=True)
+
+        assert isinstance(new_C.a._history._values, np.memmap)
+        self.assertDictEqual(self.C.state_dict(), new_C.state_dict())
+
+        # logging copies the history to memory
+        new_C.a.update(10).log()
+        assert not isinstance(new_C.a._history._values, np.memmap)
+        assert new_C.a.last_logged() == 10
+
+        # overwriting the file does not affect lazily loaded containers
+        new_C.save_to(tmp)
+        self.assertDictEqual(self.C.CC.state_dict(), new_C.CC.state_dict())
+
+        with self.assertRaises(ValueError):
+            mlogger.load_container('tmp.json', lazy=True)
+
+        os.remove(tmp)
+
+    def test_log_all(self):
+        self.C.a = mlogger.metric.Average(time_indexing=True)
+        self.C.conf = self.config
+        self.C.CC = mlogger.Container(b=mlogger.metric.Maximum(time_indexing=True),
+                                      c=mlogger.metric.Sum(time_indexing=False))
+
+        self.C.a.update(1)
+        self.C.CC.b.update(2)
+        self.C.CC.c.update(3)
+        self.C.log_all()
+        self.C.log_all()
+
+        # one wall-clock time for all time-indexed metrics
+        history_a, history_b = self.C.a._history, self.C.CC.b._history
+        np.testing.assert_allclose(history_a._times + history_a.start_time,
+                                   history_b._times + history_b.start_time)
+        np.testing.assert_array_equal(self.C.CC.c._history._times, [0, 1])
+
+        # explicit time
+        self.C.log_all(time=10)
+        assert [m._history._times[-1] for m in self.C.metrics()] == [10, 10, 10]
+
+    def test_values(self):
+        self.C.a = self.metric_a
+        self.C.conf = self.config
+        self.C.CC = self.CC
+        self.C.CC.CCC = self.CCC
+
+        self.metric_a.update(10)
+        self.CC.b.update(12)
+        self.CCC.d.update(15)
+
+        values = self.C.values()
+        assert list(values.keys()) == ['a', 'CC.b', 'CC.CCC.c', 'CC.CCC.d']
+        assert values['a'] == 10 and values['CC.b'] == 12 and values['CC.CCC.d'] == 15
+
+    def test_merge(self):
+        other = mlogger.Container(a=mlogger.metric.Simple(),
+                                  CC=mlogger.Container(b=mlogger.metric.Average()))
+        self.C.a = self.metric_a
+        self.C.CC = self.CC
+
+        self.metric_a.update(1)
+        other.a.update(2)
+        self.CC.b.update(1)
+        other.CC.b.update(3)
+        self.C.merge(other)
+
+        # Simple cannot be merged
+        assert self.C.a.value == 1
+        assert self.C.CC.b.value == 2
+
+    def test_all_reduce(self):
+        containers = [mlogger.Container(a=mlogger.metric.Average(),
+                                        b=mlogger.metric.Maximum(),
+                                        c=mlogger.metric.Minimum(),
+                                        d=mlogger.metric.Simple()) for _ in range(3)]
+        for i, container in enumerate(containers):
+            container.a.update(i)
+            container.b.update(i)
+            container.c.update(i)
+            container.d.update(i)
+
+        group = mlogger.distributed.PipeGroup(3)
+        threads = [threading.Thread(target=mlogger.distributed.all_reduce,
+                                    args=(container, group.all_reduce_fn(rank)))
+                   for rank, container in enumerate(containers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for i, container in enumerate(containers):
+            assert container.a.value == 1
+            assert container.b.value == 2
+            assert container.c.value == 0
+            assert container.d.value == i
+
+    def test_profile_report(self):
+        self.C.a = mlogger.metric.Maximum()
+        self.C.CC = self.CC
+        self.C.a.hook_on_new_max(lambda: None)
+
+        # nothing is recorded when the profiler is disabled
+        self.C.a.update(1)
+        assert mlogger.profiler.stats(self.C.a) == {}
+
+        mlogger.profiler.enable()
+        try:
+            for value in range(10):
+                self.C.a.update(value)
+                self.CC.b.update(value)
+                self.C.log_all()
+            self.C.save_to('tmp.json')
+        finally:
+            mlogger.profiler.enable(False)
+            os.remove('tmp.json')
+
+        stats = mlogger.profiler.stats(self.C.a)
+        assert stats['update'][0] == 10 and stats['to_float'][0] == 10
+        assert stats['History.log'][0] == 10 and stats['hooks_on_new_max'][0] == 8
+        assert mlogger.profiler.stats(self.C)['save_to'][0] == 1
+
+        report = self.C.profile_report().splitlines()
+        assert any(line.split()[:2] == ['CC.b', 'update'] for line in report)
+        mlogger.profiler.reset()
+        assert mlogger.profiler.stats(self.C.a) == {}
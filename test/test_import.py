@@ -0,0 +1,20 @@
+import unittest
+import json
+import subprocess
+import sys
+import mlogger
+
+
+class TestImport(unittest.TestCase):
+
+    def test_lazy_imports(self):
+        # slow or optional dependencies are only imported when used
+        lazy_modules = ['torch', 'git', 'pkg_resources', 'visdom']
+        code = ("import sys, json, mlogger; "
+                "print(json.dumps([m for m in {} if m in sys.modules]))").format(lazy_modules)
+        imported = json.loads(subprocess.check_output([sys.executable, '-c', code]).decode())
+        assert imported == []
+
+    def test_general_info(self):
+        config = mlogger.Config()
+        assert config.mlogger_version
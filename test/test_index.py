@@ -0,0 +1,87 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+import mlogger
+
+
+class TestIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def save_run(self, name, accuracies, lr):
+        xp = mlogger.Container()
+        xp.config = mlogger.Config(get_general_info=False, lr=lr, layers=[2, 3])
+        xp.val = mlogger.Container(acc=mlogger.metric.Simple(), loss=mlogger.metric.Average())
+        for accuracy in accuracies:
+            xp.val.acc.update(accuracy)
+            xp.val.acc.log()
+        filename = os.path.join(self.directory, name)
+        xp.save_to(filename)
+        return filename
+
+    def test_summary(self):
+        self.save_run('a.json', [1, 5, 3], 0.1)
+        self.save_run('b.npz', [2, 4], 0.01)
+        with open(os.path.join(self.directory, 'notes.json'), 'w') as f:
+            f.write('not a container')
+
+        with mlogger.build_index(self.directory) as index:
+            rows = index.query("SELECT * FROM metrics JOIN runs ON runs.id = run_id "
+                               "WHERE name = 'val.acc' ORDER BY path")
+            assert [os.path.basename(row['path']) for row in rows] == ['a.json', 'b.npz']
+            a = rows[0]
+            assert a['type'] == 'Simple' and a['n_points'] == 3
+            assert (a['final_value'], a['final_time']) == (3, 2)
+            assert (a['min'], a['argmin_time'], a['max'], a['argmax_time']) == (1, 0, 5, 1)
+
+            # metric without logged points
+            row, = index.query("SELECT * FROM metrics WHERE name = 'val.loss' AND run_id = ?", (a['run_id'],))
+            assert row['n_points'] == 0 and row['final_value'] is None and row['max'] is None
+
+            rows = index.query("SELECT key, value FROM config WHERE run_id = ? ORDER BY key", (a['run_id'],))
+            assert [tuple(row) for row in rows] == [('layers', '[2, 3]'), ('lr', 0.1)]
+
+            best = index.best('val.acc')
+            assert [(os.path.basename(row['path']), row['value'], row['time']) for row in best] == \
+                [('a.json', 5, 1), ('b.npz', 4, 1)]
+            assert index.best('val.acc', mode='min', n=1)[0]['value'] == 1
+
+            error, = index.query("SELECT error FROM runs WHERE path LIKE '%notes.json'")
+            assert error['error'] is not None
+
+    def test_incremental_update(self):
+        filename = self.save_run('a.json', [1], 0.1)
+        self.save_run('b.json', [2], 0.1)
+
+        index = mlogger.Index(os.path.join(self.directory, 'index.sqlite'))
+        assert index.update(self.directory) == 2
+        assert index.update(self.directory) == 0
+
+        # modified and deleted runs
+        time.sleep(0.01)
+        self.save_run('a.json', [1, 10], 0.1)
+        os.utime(filename, (time.time() + 1, time.time() + 1))
+        os.remove(os.path.join(self.directory, 'b.json'))
+        assert index.update(self.directory) == 1
+        rows = index.query("SELECT path, max FROM metrics JOIN runs ON runs.id = run_id WHERE name = 'val.acc'")
+        assert [(os.path.basename(row['path']), row['max']) for row in rows] == [('a.json', 10)]
+        index.close()
+
+    def test_retention(self):
+        xp = mlogger.Container(acc=mlogger.metric.Simple())
+        xp.acc.set_retention(mlogger.Retention(raw=10, bucket_size=5, max_buckets=4, factor=2))
+        for i in range(100):
+            xp.acc.update(-i if i == 3 else i)
+            xp.acc.log()
+        xp.save_to(os.path.join(self.directory, 'run.json'))
+
+        with mlogger.build_index(self.directory) as index:
+            row, = index.query("SELECT * FROM metrics")
+            assert row['n_points'] == 100 and row['final_value'] == 99
+            assert row['min'] == -3 and row['max'] == 99
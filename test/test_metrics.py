@@ -1,8 +1,19 @@
 import unittest
+import os
+import pickle
+import multiprocessing
+import threading
 import time
+import warnings
 import numpy as np
 
 import mlogger
+from mlogger.metric.shared import shared_memory
+
+try:
+    import torch
+except ImportError:
+    torch = None
 
 
 class TestTimer(unittest.TestCase):
@@ -75,6 +86,40 @@ class TestMaximum(unittest.TestCase):
         self.metric.update(value)
         assert self.metric.value == value_greater
 
+    def test_update_batch(self):
+
+        values = np.random.randn(100)
+        new_max = []
+        self.metric.hook_on_new_max(lambda: new_max.append(self.metric.value))
+
+        self.metric.update_batch(values)
+        assert self.metric.value == values.max()
+        assert new_max == [values.max()]
+
+        # no new maximum: hook is not called
+        self.metric.update_batch(values - 1)
+        assert new_max == [values.max()]
+
+
+class TestMinimum(unittest.TestCase):
+
+    def setUp(self):
+
+        self.metric = mlogger.metric.Minimum()
+
+    def test_update_batch(self):
+
+        values = np.random.randn(100)
+        new_min = []
+        self.metric.hook_on_new_min(lambda: new_min.append(self.metric.value))
+
+        self.metric.update_batch(values)
+        assert self.metric.value == values.min()
+        assert new_min == [values.min()]
+
+        self.metric.update_batch(np.array([]))
+        assert new_min == [values.min()]
+
 
 class TestAverage(unittest.TestCase):
 
@@ -99,6 +144,23 @@ class TestAverage(unittest.TestCase):
         np.testing.assert_allclose(self.metric.value,
                                    np.sum(values * weights) / np.sum(weights))
 
+    def test_update_batch(self):
+
+        values = np.random.random(size=(4, 10))
+        weights = 100 * np.random.rand(4, 10) + 1e-10
+
+        self.metric.update(values[0, 0], weighting=weights[0, 0])
+        self.metric.update_batch(values[0, 1:], weights[0, 1:])
+        self.metric.update_batch(values[1:], weights[1:])
+
+        np.testing.assert_allclose(self.metric.value,
+                                   np.sum(values * weights) / np.sum(weights))
+
+        # unweighted batch
+        self.metric.reset()
+        self.metric.update_batch(values)
+        np.testing.assert_allclose(self.metric.value, np.mean(values))
+
 
 class TestSum(unittest.TestCase):
 
@@ -122,3 +184,741 @@ class TestSum(unittest.TestCase):
 
         np.testing.assert_allclose(self.metric.value,
                                    np.sum(values * weights))
+
+    def test_update_batch(self):
+
+        values = np.random.random(size=10)
+        weights = np.random.randint(1, 100, size=10)
+
+        self.metric.update_batch(values[:5], weights[:5])
+        self.metric.update_batch(values[5:], weights[5:])
+
+        np.testing.assert_allclose(self.metric.value,
+                                   np.sum(values * weights))
+
+
+class TestHistory(unittest.TestCase):
+
+    def setUp(self):
+
+        self.metric = mlogger.metric.Simple(time_indexing=False)
+
+    def test_log(self):
+
+        n_logs = 100
+        values = np.random.randn(n_logs)
+        for value in values:
+            self.metric.update(value).log()
+
+        history = self.metric._history
+        assert len(history) == n_logs
+        np.testing.assert_array_equal(history._times, np.arange(n_logs))
+        np.testing.assert_array_equal(history._values, values)
+        assert self.metric.last_logged() == values[-1]
+
+    def test_state_dict(self):
+
+        for value in range(5):
+            self.metric.update(value).log()
+
+        state = self.metric._history.state_dict()
+        assert state['times'] == [0., 1., 2., 3., 4.]
+        assert state['values'] == [0., 1., 2., 3., 4.]
+
+        new_history = mlogger.metric.Simple()._history
+        new_history.load_state_dict(state)
+        self.assertDictEqual(new_history.state_dict(), state)
+
+        # logging after loading grows the loaded buffers
+        new_history.log(new_history.time(), 5.)
+        assert new_history.state_dict()['times'][-1] == 5.
+
+    def test_non_scalar_values(self):
+
+        history = self.metric._history
+        history.log(0, 1.)
+        history.log(1, (2., 3.))
+
+        assert history.state_dict()['values'] == [1., (2., 3.)]
+        assert history.last_value == (2., 3.)
+        assert history.count == 0 and history.max is None
+
+    def test_queries(self):
+
+        values = [3., 1., np.nan, 7., 5.]
+        for value in values:
+            self.metric.update(value).log()
+        history = self.metric._history
+
+        # lookup by time
+        assert history.at(-1) is None
+        assert history.at(3) == 7 and history.at(3.5) == 7
+        assert self.metric.logged_at(10) == 5
+        times, values = self.metric.logged_between(1, 3)
+        np.testing.assert_array_equal(times, [1, 2, 3])
+        np.testing.assert_array_equal(values, [1, np.nan, 7])
+
+        # running statistics (NaN ignored)
+        assert history.count == 4 and history.sum() == 16
+        assert self.metric.best_logged() == (3, 7)
+        assert self.metric.best_logged('min') == (1, 1)
+        assert self.metric.mean_logged() == 4
+
+        # range aggregates
+        assert history.sum(1, 3) == 8 and history.mean(1, 3) == 4
+        assert history.mean(start=4) == 5 and history.mean(10, 20) is None
+
+        # updated by log
+        self.metric.update(-1).log()
+        assert self.metric.best_logged('min') == (5, -1)
+        assert history.mean(start=4) == 2
+
+        # recomputed after loading
+        new_history = mlogger.metric.Simple()._history
+        new_history.load_state_dict(history.state_dict())
+        assert (new_history.count, new_history.min, new_history.argmax) == (5, -1, 3)
+
+    def test_queries_with_retention(self):
+
+        self.metric.set_retention(mlogger.Retention(raw=10, bucket_size=5, max_buckets=4, factor=2))
+        for value in range(100):
+            self.metric.update(value).log()
+        history = self.metric._history
+
+        assert len(history) < 100
+        assert history.count == 100 and history.sum() == sum(range(100))
+        assert (history.argmin, history.min) == (0, 0)
+        np.testing.assert_allclose(history.mean(90, 99), 94.5)
+        assert history.at(10) is None
+
+
+@unittest.skipIf(torch is None, "pytorch is not installed")
+class TestDeferSync(unittest.TestCase):
+
+    def test_accumulators(self):
+
+        values = np.random.random(size=10)
+        weights = np.random.randint(1, 100, size=10)
+
+        for metric in (mlogger.metric.Average(), mlogger.metric.Sum()):
+            reference = type(metric)()
+            metric.defer_sync()
+
+            for k in range(5):
+                metric.update(torch.tensor(values[k]), weighting=weights[k])
+                reference.update(values[k], weighting=weights[k])
+            metric.update_batch(torch.tensor(values[5:]), weights[5:])
+            reference.update_batch(values[5:], weights[5:])
+
+            # nothing has been converted to float yet
+            assert torch.is_tensor(metric._pending_sum)
+            np.testing.assert_allclose(metric.value, reference.value)
+            assert metric._pending_sum is None
+            np.testing.assert_allclose(metric.state_dict()['avg'],
+                                       reference.state_dict()['avg'])
+
+    def test_not_supported(self):
+
+        for metric in (mlogger.metric.Simple(), mlogger.metric.EMA(0.9), mlogger.metric.WindowedAverage(5),
+                       mlogger.metric.Timer(), mlogger.metric.Histogram(3, 0, 1), mlogger.metric.Quantile()):
+            with self.assertRaises(AssertionError):
+                metric.defer_sync()
+            # disabling is always possible
+            metric.defer_sync(False)
+
+    def test_extrema(self):
+
+        values = torch.randn(10)
+        maximum, minimum = mlogger.metric.Maximum(), mlogger.metric.Minimum()
+        calls = []
+        maximum.hook_on_new_max(lambda: calls.append('max'))
+        minimum.hook_on_new_min(lambda: calls.append('min'))
+
+        for metric, expected in ((maximum, values.max()), (minimum, values.min())):
+            metric.defer_sync()
+            del calls[:]
+
+            for val in values[:5]:
+                metric.update(val)
+            metric.update_batch(values[5:])
+
+            # hooks are called once, when the value is read
+            assert calls == []
+            assert metric.log().last_logged() == float(expected)
+            assert len(calls) == 1
+
+
+class TestToFloat(unittest.TestCase):
+
+    def test_conversion(self):
+
+        to_float = mlogger.metric.to_float
+        for val in (0.5, 3, True, np.float32(0.5), np.int64(3), np.array(0.5), np.array([0.5])):
+            assert to_float(val) == float(np.asarray(val).item())
+            assert type(to_float(val)) is float
+
+        with self.assertRaises(AssertionError):
+            to_float(np.zeros(2))
+
+        with self.assertRaises(TypeError):
+            to_float(None)
+
+
+class TestRetention(unittest.TestCase):
+
+    def setUp(self):
+
+        self.retention = mlogger.Retention(raw=100, bucket_size=10, max_buckets=10, factor=10)
+        self.metric = mlogger.metric.Simple(time_indexing=False).set_retention(self.retention)
+
+    def test_log(self):
+
+        n_logs = 100000
+        values = np.random.randn(n_logs)
+        for value in values:
+            self.metric.update(value).log()
+
+        history = self.metric._history
+        rollups = history.rollups
+
+        # bounded memory
+        assert len(history) < 2 * self.retention.raw
+        assert len(rollups) <= 10 * len(history._rollups)
+        assert len(history._rollups) <= 5
+
+        # all points are accounted for
+        counts = rollups[:, mlogger.metric.history.ROLLUP_FIELDS.index('count')]
+        assert counts.sum() + len(history) == n_logs
+        np.testing.assert_array_equal(history._values, values[-len(history):])
+        np.testing.assert_allclose(np.dot(rollups[:, 3], counts), values[:-len(history)].sum())
+        assert rollups[:, 4].min() == values[:-len(history)].min()
+        assert rollups[:, 5].max() == values[:-len(history)].max()
+
+        # full run is available for plotting
+        times, series = history.series()
+        assert rollups[0, 0] == 0 and times[-1] == n_logs - 1
+        assert np.all(np.diff(times) > 0)
+
+        # increment indexing continues after eviction
+        assert history.time() == n_logs
+
+    def test_state_dict(self):
+
+        for value in range(1000):
+            self.metric.update(value).log()
+
+        state = self.metric.state_dict()
+        new_metric = mlogger.metric.Simple(time_indexing=False)
+        new_metric.load_state_dict(state)
+
+        self.assertDictEqual(new_metric.state_dict(), state)
+        np.testing.assert_array_equal(new_metric._history.rollups, self.metric._history.rollups)
+
+    def test_few_buckets(self):
+
+        # fewer buckets per level than buckets merged at once
+        retention = mlogger.Retention(raw=10, bucket_size=2, max_buckets=1, factor=10)
+        metric = mlogger.metric.Simple(time_indexing=False).set_retention(retention)
+        for value in range(5000):
+            metric.update(value).log()
+
+        history = metric._history
+        assert all(len(level) < retention.factor for level in history._rollups)
+        counts = history.rollups[:, mlogger.metric.history.ROLLUP_FIELDS.index('count')]
+        assert counts.sum() + len(history) == 5000
+        assert history.min == 0 and history.max == 4999
+
+    def test_nan(self):
+
+        retention = mlogger.Retention(raw=10, bucket_size=10, max_buckets=2, factor=2)
+        metric = mlogger.metric.Simple(time_indexing=False).set_retention(retention)
+        values = np.arange(200.)
+        values[5] = np.nan
+        # a bucket of NaN values only
+        values[20:30] = np.nan
+        for value in values:
+            metric.update(value).log()
+
+        history = metric._history
+        count, total = np.sum(~np.isnan(values)), np.nansum(values)
+        assert history.count == count and history.sum() == total
+
+        new_metric = mlogger.metric.Simple(time_indexing=False)
+        new_metric.load_state_dict(metric.state_dict())
+        history = new_metric._history
+        assert history.count == count and history.sum() == total
+        np.testing.assert_allclose(history.mean(), total / count)
+
+    def test_default(self):
+
+        mlogger.use_retention(self.retention)
+        try:
+            assert mlogger.metric.Average()._history.retention is self.retention
+        finally:
+            mlogger.use_retention(None)
+        assert mlogger.metric.Average()._history.retention is None
+
+
+class TestHistogram(unittest.TestCase):
+
+    def setUp(self):
+
+        self.metric = mlogger.metric.Histogram(10, 0., 1.)
+
+    def test_update(self):
+
+        values = np.random.random(size=1000)
+        weights = np.random.randint(1, 10, size=1000)
+        self.metric.update(-1.)
+        self.metric.update(2., weighting=3)
+        self.metric.update_batch(values, weights)
+
+        counts, _ = np.histogram(values, bins=10, range=(0., 1.), weights=weights)
+        np.testing.assert_allclose(self.metric.value, counts)
+        assert self.metric.underflow == 1 and self.metric.overflow == 3
+
+    def test_log_bins(self):
+
+        metric = mlogger.metric.Histogram(3, 1., 1000., log=True)
+        metric.update_batch([0., 1., 5., 50., 500., 1000., np.nan])
+        np.testing.assert_array_equal(metric.value, [2, 1, 2])
+        assert metric.underflow == 1
+
+    def test_single_updates(self):
+
+        values = np.concatenate([np.random.uniform(-0.5, 1.5, size=1000), self.metric.edges, [np.nan]])
+        other = mlogger.metric.Histogram(10, 0., 1.)
+        for value in values:
+            self.metric.update(value, weighting=2)
+        other.update_batch(values, 2)
+        np.testing.assert_array_equal(self.metric._counts, other._counts)
+
+    def test_no_plotter(self):
+
+        plotter = object()
+        self.assertRaises(AssertionError, mlogger.metric.Histogram, 10, 0., 1., plotter=plotter)
+        self.assertRaises(TypeError, self.metric.plot_on, plotter, 'title')
+
+    def test_merge_and_state_dict(self):
+
+        values = np.random.random(size=100)
+        other = mlogger.metric.Histogram(10, 0., 1.)
+        self.metric.update_batch(values[:50])
+        other.update_batch(values[50:])
+        self.metric.merge(other).log()
+
+        counts, _ = np.histogram(values, bins=10, range=(0., 1.))
+        np.testing.assert_array_equal(self.metric.value, counts)
+
+        new_metric = mlogger.metric.Histogram(10, 0., 1.)
+        new_metric.load_state_dict(self.metric.state_dict())
+        self.assertDictEqual(new_metric.state_dict(), self.metric.state_dict())
+        np.testing.assert_array_equal(new_metric.last_logged(), counts)
+
+
+class TestQuantile(unittest.TestCase):
+
+    def setUp(self):
+
+        self.metric = mlogger.metric.Quantile(0.99, relative_accuracy=0.01)
+
+    def test_update(self):
+
+        values = np.random.randn(10000) * 10
+        values[:100] = 0
+        for value in values[:100]:
+            self.metric.update(value)
+        self.metric.update_batch(values[100:])
+
+        for q in (0., 0.01, 0.25, 0.5, 0.75, 0.99, 1.):
+            expected = np.quantile(values, q, method='inverted_cdf')
+            np.testing.assert_allclose(self.metric.quantile(q), expected, rtol=0.011)
+        assert self.metric.value == self.metric.quantile(0.99)
+        assert self.metric.count == len(values)
+
+    def test_single_updates(self):
+
+        values = np.concatenate([np.random.randn(1000) * 10, np.exp(np.random.uniform(-50, 50, size=1000)),
+                                 [0., np.inf, -np.inf, np.nan]])
+        other = mlogger.metric.Quantile(0.99, relative_accuracy=0.01, max_bins=100)
+        metric = mlogger.metric.Quantile(0.99, relative_accuracy=0.01, max_bins=100)
+        for value in values:
+            metric.update(value, weighting=2)
+        other.update_batch(values, 2)
+        self.assertDictEqual(metric.state_dict(), other.state_dict())
+
+    def test_infinite_values(self):
+
+        self.metric.update(float('inf'))
+        self.metric.update_batch([-np.inf, 1., 2., np.nan])
+        assert self.metric.count == 4
+        assert self.metric.quantile(0.) == -np.inf and self.metric.quantile(1.) == np.inf
+        np.testing.assert_allclose(self.metric.quantile(0.5), 1., rtol=0.011)
+
+        new_metric = mlogger.metric.Quantile(0.99, relative_accuracy=0.01)
+        new_metric.load_state_dict(self.metric.state_dict())
+        new_metric.merge(self.metric)
+        assert new_metric.count == 8 and new_metric.value == np.inf
+
+    def test_bounded_memory(self):
+
+        metric = mlogger.metric.Quantile(0.5, max_bins=100)
+        metric.update_batch(np.exp(np.random.uniform(-50, 50, size=10000)))
+        assert len(metric._positive.counts) <= 100
+
+        # upper quantiles are still accurate
+        assert metric.quantile(1.) > 1e21
+
+    def test_merge_and_state_dict(self):
+
+        values = np.random.rand(1000)
+        other = mlogger.metric.Quantile(0.99, relative_accuracy=0.01)
+        self.metric.update_batch(values[:500])
+        other.update_batch(values[500:])
+        self.metric.merge(other)
+        np.testing.assert_allclose(self.metric.value, np.quantile(values, 0.99), rtol=0.02)
+
+        xp = mlogger.Container(q=self.metric)
+        new_xp = mlogger.Container()
+        new_xp.load_state_dict(xp.state_dict())
+        self.assertDictEqual(new_xp.state_dict(), xp.state_dict())
+        assert new_xp.q.value == self.metric.value
+
+
+class TestEMA(unittest.TestCase):
+
+    def setUp(self):
+
+        self.decay = 0.9
+        self.metric = mlogger.metric.EMA(self.decay)
+
+    def expected(self, values, weights):
+        decays = self.decay ** np.arange(len(values) - 1, -1, -1)
+        return np.sum(decays * weights * values) / np.sum(decays * weights)
+
+    def test_update(self):
+
+        values = np.random.randn(50)
+        weights = np.random.randint(1, 10, size=50)
+        self.metric.update(values[0])
+        np.testing.assert_allclose(self.metric.value, values[0])
+
+        for value, weight in zip(values[1:], weights[1:]):
+            self.metric.update(value, weighting=weight)
+        weights[0] = 1
+        np.testing.assert_allclose(self.metric.value, self.expected(values, weights))
+
+    def test_update_batch(self):
+
+        values = np.random.randn(50)
+        weights = np.random.randint(1, 10, size=50)
+        for value, weight in zip(values[:10], weights[:10]):
+            self.metric.update(value, weighting=weight)
+        self.metric.update_batch(values[10:30], weights[10:30])
+        self.metric.update_batch(values[30:], weights[30:])
+        np.testing.assert_allclose(self.metric.value, self.expected(values, weights))
+
+        new_metric = mlogger.metric.EMA(self.decay)
+        new_metric.load_state_dict(self.metric.state_dict())
+        new_metric.update(1.)
+        self.metric.update(1.)
+        assert new_metric.value == self.metric.value
+
+
+class TestWindowedAverage(unittest.TestCase):
+
+    def setUp(self):
+
+        self.metric = mlogger.metric.WindowedAverage(10)
+
+    def test_init(self):
+
+        assert self.metric.value == 0.
+
+    def test_update(self):
+
+        values = np.random.randn(35)
+        weights = np.random.randint(1, 10, size=35)
+        for k in range(35):
+            self.metric.update(values[k], weighting=weights[k])
+            start = max(0, k - 9)
+            np.testing.assert_allclose(self.metric.value,
+                                       np.average(values[start:k + 1], weights=weights[start:k + 1]))
+
+    def test_update_batch(self):
+
+        values = np.random.randn(100)
+        self.metric.update(values[0])
+        for start, end in ((1, 4), (4, 11), (11, 12), (12, 50), (50, 57)):
+            self.metric.update_batch(values[start:end])
+            np.testing.assert_allclose(self.metric.value, np.mean(values[max(0, end - 10):end]))
+
+        new_metric = mlogger.metric.WindowedAverage(10)
+        new_metric.load_state_dict(self.metric.state_dict())
+        new_metric.update(values[57])
+        self.metric.update(values[57])
+        np.testing.assert_allclose(new_metric.value, np.mean(values[48:58]))
+        assert new_metric.value == self.metric.value
+
+
+class TestMerge(unittest.TestCase):
+
+    def test_merge_accumulators(self):
+        average_a, average_b = mlogger.metric.Average(), mlogger.metric.Average()
+        average_a.update(1, weighting=2)
+        average_b.update(4)
+        average_a.merge(average_b)
+        assert average_a.value == 2
+        assert average_a._total_weight == 3
+
+        sum_a, sum_b = mlogger.metric.Sum(), mlogger.metric.Sum()
+        sum_a.update(1)
+        sum_b.update(2)
+        assert sum_a.merge(sum_b).value == 3
+
+    def test_merge_extrema(self):
+        maximum_a, maximum_b = mlogger.metric.Maximum(), mlogger.metric.Maximum()
+        maximum_a.update(1)
+        maximum_b.update(5)
+        assert maximum_a.merge(maximum_b).value == 5
+
+        minimum_a, minimum_b = mlogger.metric.Minimum(), mlogger.metric.Minimum()
+        minimum_a.update(1)
+        assert minimum_a.merge(minimum_b).value == 1
+
+    def test_merge_distributions(self):
+        histogram_a = mlogger.metric.Histogram(4, 0, 4)
+        histogram_b = mlogger.metric.Histogram(4, 0, 4)
+        histogram_a.update_batch([0.5, 1.5])
+        histogram_b.update_batch([1.5, 10])
+        histogram_a.merge(histogram_b)
+        np.testing.assert_array_equal(histogram_a.value, [1, 2, 0, 0])
+        assert histogram_a.overflow == 1
+
+        quantile_a, quantile_b = mlogger.metric.Quantile(), mlogger.metric.Quantile()
+        quantile_a.update_batch(np.arange(1, 51))
+        quantile_b.update_batch(np.arange(51, 101))
+        quantile_a.merge(quantile_b)
+        assert quantile_a.count == 100
+        np.testing.assert_allclose(quantile_a.value, 50, rtol=0.01)
+
+    def test_mergeable(self):
+        assert mlogger.metric.Average().mergeable and mlogger.metric.Average().packable
+        assert mlogger.metric.Quantile().mergeable and not mlogger.metric.Quantile().packable
+        assert not mlogger.metric.Simple().mergeable
+        with self.assertRaises(NotImplementedError):
+            mlogger.metric.Simple().merge(mlogger.metric.Simple())
+        with self.assertRaises(AssertionError):
+            mlogger.metric.Sum().merge(mlogger.metric.Average())
+
+
+def _update_sink(sink, values):
+    for value in values:
+        sink.update(value)
+
+
+def _die_while_writing(sink, value):
+    # exit between the two increments of the sequence number of the slot
+    sink.update(value)
+    sink._seqs[sink._slot] += 1
+    os._exit(0)
+
+
+@unittest.skipIf(shared_memory is None, "multiprocessing.shared_memory is not available")
+class TestShared(unittest.TestCase):
+
+    def run_processes(self, sink, values, context=None):
+        context = multiprocessing.get_context(context)
+        processes = [context.Process(target=_update_sink, args=(sink, v)) for v in values]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            assert process.exitcode == 0
+
+    def test_sum(self):
+        metric = mlogger.metric.Sum()
+        metric.update(1)
+        sink = metric.share(n_slots=4)
+        metric.update(2)
+        self.run_processes(sink, [[10, 20], [100]])
+        assert metric.value == 133
+
+        metric.log()
+        assert metric.last_logged() == 133
+        metric.unshare()
+        assert metric.value == 133
+
+    def test_slots_are_released(self):
+        metric = mlogger.metric.Maximum()
+        sink = metric.share(n_slots=2)
+        for i in range(5):
+            self.run_processes(sink, [[i]])
+        assert metric.value == 4
+        metric.unshare()
+
+    def test_spawn(self):
+        metric = mlogger.metric.Average()
+        sink = metric.share(n_slots=4, context='spawn')
+        self.run_processes(sink, [[1, 2], [3]], context='spawn')
+        assert metric.value == 2
+        metric.unshare()
+
+    def test_reset(self):
+        metric = mlogger.metric.Minimum()
+        sink = metric.share(n_slots=4)
+        self.run_processes(sink, [[1]])
+        assert metric.value == 1
+        metric.reset()
+        assert metric.value == np.inf
+        self.run_processes(sink, [[5]])
+        metric.update(7)
+        assert metric.value == 5
+        metric.unshare()
+
+    def test_timer_and_histogram(self):
+        timer = mlogger.metric.Timer()
+        sink = timer.share(n_slots=4)
+        self.run_processes(sink, [[None]])
+        assert timer.value > 0
+        timer.unshare()
+
+        histogram = mlogger.metric.Histogram(2, 0, 2)
+        sink = histogram.share(n_slots=4)
+        self.run_processes(sink, [[0.5], [1.5, 1.5]])
+        np.testing.assert_array_equal(histogram.value, [1, 2])
+        histogram.unshare()
+
+    def test_hooks(self):
+        metric = mlogger.metric.Maximum()
+        calls = []
+        metric.hook_on_new_max(lambda: calls.append(metric._val))
+        sink = metric.share(n_slots=4)
+        self.run_processes(sink, [[1, 5], [3]])
+        assert metric.value == 5 and calls == [5]
+        assert metric.value == 5 and calls == [5]
+        metric.unshare()
+
+    def test_writer_died(self):
+        metric = mlogger.metric.Sum()
+        sink = metric.share(n_slots=4)
+        process = multiprocessing.Process(target=_die_while_writing, args=(sink, 100))
+        process.start()
+        process.join()
+        self.run_processes(sink, [[1]])
+
+        timeout = mlogger.metric.shared._READ_TIMEOUT
+        mlogger.metric.shared._READ_TIMEOUT = 0.1
+        try:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                assert metric.value == 1
+                # the lost slot is skipped without waiting
+                start = time.time()
+                assert metric.value == 1
+                assert time.time() - start < 0.1
+            assert len(caught) == 1
+        finally:
+            mlogger.metric.shared._READ_TIMEOUT = timeout
+        metric.unshare()
+
+    def test_not_shareable(self):
+        with self.assertRaises(AssertionError):
+            mlogger.metric.Simple().share()
+        # the slots of exited processes would be summed without decay
+        with self.assertRaises(AssertionError):
+            mlogger.metric.EMA(0.5).share()
+
+
+class TestThreadSafe(unittest.TestCase):
+
+    def run_threads(self, target, n_threads=16):
+        threads = [threading.Thread(target=target, args=(i,)) for i in range(n_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_stress(self):
+        average = mlogger.metric.Average().thread_safe()
+        total = mlogger.metric.Sum().thread_safe()
+        maximum = mlogger.metric.Maximum().thread_safe()
+        n_updates = 2000
+
+        def target(i):
+            for j in range(n_updates):
+                average.update(i)
+                total.update(1)
+                maximum.update(i * n_updates + j)
+                if not j % 100:
+                    # concurrent reads and logs
+                    average.log()
+                    total.update_batch(np.ones(10))
+
+        self.run_threads(target)
+        assert total.value == 16 * (n_updates + 20 * 10)
+        assert average.value == 7.5
+        assert maximum.value == 16 * n_updates - 1
+        assert len(average._history) == 16 * 20
+
+    def test_running_threads(self):
+        total = mlogger.metric.Sum()
+        total.update(5)
+        total.thread_safe()
+        started, stop = threading.Event(), threading.Event()
+
+        def target():
+            total.update(1)
+            started.set()
+            stop.wait()
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        started.wait()
+        total.update(2)
+        assert total.value == 8
+        stop.set()
+        thread.join()
+        assert total.value == 8
+
+        total.reset()
+        assert total.value == 0
+        total.update(3)
+        total.thread_safe(False)
+        assert total.value == 3
+        total.update(1)
+        assert total.value == 4
+
+    def test_hooks(self):
+        minimum = mlogger.metric.Minimum().thread_safe()
+        calls = []
+        minimum.hook_on_new_min(lambda: calls.append(minimum._val))
+
+        def target(i):
+            minimum.update(10 - i)
+
+        self.run_threads(target, n_threads=4)
+        assert minimum.value == 7 and calls == [7]
+        minimum.update(8)
+        assert minimum.value == 7 and calls == [7]
+
+    def test_history_lock(self):
+        # only the histories of thread-safe metrics are locked
+        total = mlogger.metric.Sum()
+        assert total._history._lock is mlogger.metric.history._NO_LOCK
+        total.thread_safe()
+        assert total._history._lock is not mlogger.metric.history._NO_LOCK
+        history = pickle.loads(pickle.dumps(total._history))
+        assert history._lock is not mlogger.metric.history._NO_LOCK
+        total.thread_safe(False)
+        assert total._history._lock is mlogger.metric.history._NO_LOCK
+
+    def test_not_supported(self):
+        with self.assertRaises(AssertionError):
+            mlogger.metric.Simple().thread_safe()
+        # the states of exited threads would be summed without decay
+        ema = mlogger.metric.EMA(0.5)
+        for _ in range(100):
+            ema.update(10)
+        with self.assertRaises(AssertionError):
+            ema.thread_safe()
@@ -0,0 +1,212 @@
+import unittest
+import threading
+import numpy as np
+
+import mlogger
+import mlogger.plotter.visdom_plotter as visdom_plotter
+
+
+class StubVisdom(object):
+    """ Records the requests instead of sending them to a visdom server.
+    Requests block while self.gate is cleared.
+    """
+    def __init__(self, **kwargs):
+        self.lines = []
+        self.texts = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def line(self, Y, X=None, opts=None, win=None, name=None, update=None):
+        self.gate.wait()
+        if win is None:
+            return 'window_{}'.format(opts['title'])
+        self.lines.append((win, name, np.asarray(X), np.asarray(Y)))
+        return win
+
+    def text(self, text, win=None, append=False):
+        self.gate.wait()
+        if win is None:
+            return 'text_window'
+        self.texts.append((win, text))
+        return win
+
+    def points(self, win, name):
+        lines = [(x, y) for (w, n, x, y) in self.lines if w == win and n == name]
+        if not lines:
+            return np.array([]), np.array([])
+        return (np.concatenate([x for x, _ in lines]),
+                np.concatenate([y for _, y in lines]))
+
+
+class StubVisdomModule(object):
+    Visdom = StubVisdom
+
+
+class TestVisdomPlotter(unittest.TestCase):
+
+    def setUp(self):
+        self.visdom = visdom_plotter.visdom
+        visdom_plotter.visdom = StubVisdomModule
+
+    def tearDown(self):
+        visdom_plotter.visdom = self.visdom
+
+    def test_update(self):
+        plotter = mlogger.VisdomPlotter({})
+        metric = mlogger.metric.Simple(plotter=plotter, plot_title="title", plot_legend="legend")
+        for value in range(5):
+            metric.update(value).log()
+
+        # one request per log
+        assert len(plotter.viz.lines) == 5
+        x, y = plotter.viz.points('window_title', 'legend')
+        np.testing.assert_array_equal(y, np.arange(5))
+
+    def test_plot_on(self):
+        plotter = mlogger.VisdomPlotter({}, manual_update=True)
+        metric = mlogger.metric.Simple()
+        for value in range(5):
+            metric.update(value).log()
+
+        # history replay followed by new logs
+        metric.plot_on(plotter, "title", "legend")
+        metric.update(5).log()
+        plotter.update_plots()
+
+        assert len(plotter.viz.lines) == 1
+        x, y = plotter.viz.points('window_title', 'legend')
+        np.testing.assert_array_equal(x, np.arange(6))
+        np.testing.assert_array_equal(y, np.arange(6))
+
+    def test_asynchronous(self):
+        plotter = mlogger.VisdomPlotter({}, asynchronous=True)
+        plotter.viz.gate.clear()
+
+        metric = mlogger.metric.Simple(plotter=plotter, plot_title="title", plot_legend="legend")
+        for value in range(100):
+            metric.update(value).log()
+
+        # logging does not wait for the server
+        assert plotter.viz.lines == []
+
+        plotter.viz.gate.set()
+        assert plotter.wait(timeout=10)
+
+        # pending points are coalesced in few requests
+        assert len(plotter.viz.lines) < 100
+        x, y = plotter.viz.points('window_title', 'legend')
+        np.testing.assert_array_equal(y, np.arange(100))
+
+    def test_asynchronous_overflow(self):
+        for overflow in ('drop', 'spill'):
+            plotter = mlogger.VisdomPlotter({}, asynchronous=True, queue_size=10, overflow=overflow)
+            plotter.viz.gate.clear()
+
+            metric = mlogger.metric.Simple(plotter=plotter, plot_title="title", plot_legend="legend")
+            for value in range(100):
+                metric.update(value).log()
+
+            plotter.viz.gate.set()
+            assert plotter.wait(timeout=10)
+
+            x, y = plotter.viz.points('window_title', 'legend')
+            if overflow == 'drop':
+                assert plotter.n_dropped > 0
+                assert len(y) == 100 - plotter.n_dropped
+            else:
+                assert plotter.n_dropped == 0
+                np.testing.assert_array_equal(y, np.arange(100))
+
+    def test_decimation(self):
+        for decimation in ('minmax', 'lttb'):
+            plotter = mlogger.VisdomPlotter({}, max_points=100, decimation=decimation)
+
+            metric = mlogger.metric.Simple()
+            values = np.random.rand(10000)
+            values[5000] = 10.
+            for value in values:
+                metric.update(value).log()
+            metric.plot_on(plotter, "title", "legend")
+
+            x, y = plotter.viz.points('window_title', 'legend')
+            assert len(x) <= 100
+            assert x[0] == 0 and x[-1] == 9999
+            assert np.all(np.diff(x) > 0)
+            np.testing.assert_array_equal(y, values[x.astype(int)])
+            # spikes are kept
+            assert y.max() == 10.
+
+
+class TestDecimation(unittest.TestCase):
+
+    def test_minmax(self):
+        x = np.arange(1000.)
+        y = np.sin(x / 10.)
+        y[10] = np.nan
+        dx, dy = mlogger.plotter.decimation.minmax(x, y, 50)
+
+        assert len(dx) <= 50
+        # every bucket contributes its extrema
+        assert dy.max() == np.nanmax(y[1:-1]) and dy.min() == np.nanmin(y[1:-1])
+
+        # short series are not modified
+        dx, dy = mlogger.plotter.decimation.minmax(x[:10], y[:10], 50)
+        assert len(dx) == 10
+
+
+class TestFlushPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.visdom = visdom_plotter.visdom
+        visdom_plotter.visdom = StubVisdomModule
+
+    def tearDown(self):
+        visdom_plotter.visdom = self.visdom
+
+    def log(self, plotter, n):
+        metric = mlogger.metric.Simple(plotter=plotter, plot_title="title", plot_legend="legend")
+        for value in range(n):
+            metric.update(value).log()
+
+    def test_flush_points(self):
+        plotter = mlogger.VisdomPlotter({}, flush_points=10)
+        self.log(plotter, 25)
+
+        assert [len(y) for (_, _, _, y) in plotter.viz.lines] == [10, 10]
+
+        plotter.update_plots()
+        x, y = plotter.viz.points('window_title', 'legend')
+        np.testing.assert_array_equal(y, np.arange(25))
+
+    def test_flush_interval(self):
+        plotter = mlogger.VisdomPlotter({}, flush_interval=3600)
+        self.log(plotter, 25)
+        assert plotter.viz.lines == []
+
+        plotter = mlogger.VisdomPlotter({}, flush_interval=0)
+        self.log(plotter, 25)
+        assert len(plotter.viz.lines) == 25
+
+    def test_asynchronous(self):
+        plotter = mlogger.VisdomPlotter({}, asynchronous=True, flush_points=10)
+        self.log(plotter, 25)
+        assert plotter.wait(timeout=10)
+
+        x, y = plotter.viz.points('window_title', 'legend')
+        np.testing.assert_array_equal(y, np.arange(25))
+
+    def test_log_all(self):
+        plotter = mlogger.VisdomPlotter({}, flush_points=4)
+        xp = mlogger.Container()
+        xp.train = mlogger.metric.Simple(plotter=plotter, plot_title="title", plot_legend="train")
+        xp.val = mlogger.metric.Simple(plotter=plotter, plot_title="title", plot_legend="val")
+
+        for value in range(4):
+            xp.train.update(value)
+            xp.val.update(-value)
+            xp.log_all()
+
+        # both legends are sent together once flush_points is reached
+        assert [name for (_, name, _, _) in plotter.viz.lines] == ['train', 'val', 'train', 'val']
+        x, y = plotter.viz.points('window_title', 'val')
+        np.testing.assert_array_equal(y, -np.arange(4))
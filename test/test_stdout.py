@@ -0,0 +1,92 @@
+import unittest
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import mlogger
+
+
+class TestStdout(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'out.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, filename=None):
+        with open(filename or self.filename) as f:
+            return f.read()
+
+    def test_stdout_to(self):
+        with mlogger.stdout_to(self.filename):
+            print("hello")
+        assert self.read() == "hello\n"
+
+        with mlogger.stdout_to(self.filename, enabled=False):
+            print("not saved")
+        assert self.read() == "hello\n"
+
+    def test_buffered(self):
+        writer = mlogger.stdout_to(self.filename, buffered=True, flush_interval=60, stderr=True)
+        with writer:
+            print("line 1", flush=True)
+            sys.stderr.write("error\n")
+            # nothing written before a threshold
+            assert self.read() == ""
+        assert self.read() == "line 1\nerror\n"
+        assert sys.stdout is writer.terminal
+
+    def test_buffer_size(self):
+        writer = mlogger.stdout_to(self.filename, buffered=True, buffer_size=10, flush_interval=60)
+        with writer:
+            # a single write (print makes two), so that the writer cannot
+            # flush part of the message
+            sys.stdout.write("0123456789\n")
+            for _ in range(100):
+                if self.read():
+                    break
+                writer._writer.join(0.01)
+            assert self.read() == "0123456789\n"
+
+    def test_print_does_not_wait_on_file(self):
+        writer = mlogger.stdout_to(self.filename, buffered=True, buffer_size=1, flush_interval=60)
+        writing, release = threading.Event(), threading.Event()
+        write = writer._write
+
+        def slow_write(text):
+            writing.set()
+            release.wait()
+            write(text)
+
+        writer._write = slow_write
+        with writer:
+            sys.stdout.write("first\n")
+            assert writing.wait(10)
+            # the writer thread is blocked in the file system
+            printer = threading.Thread(target=sys.stdout.write, args=("second\n",))
+            printer.start()
+            printer.join(10)
+            blocked = printer.is_alive()
+            release.set()
+            printer.join()
+            assert not blocked
+        assert self.read() == "first\nsecond\n"
+
+    def test_rotation(self):
+        with mlogger.stdout_to(self.filename, max_bytes=10, backup_count=2):
+            for i in range(4):
+                print("line {}...".format(i))
+        assert self.read() == "line 3...\n"
+        assert self.read(self.filename + '.1') == "line 2...\n"
+        assert self.read(self.filename + '.2') == "line 1...\n"
+        assert not os.path.exists(self.filename + '.3')
+
+        with mlogger.stdout_to(self.filename, buffered=True, max_bytes=10, compress=True):
+            print("line 4...")
+        with gzip.open(self.filename + '.1.gz', 'rt') as f:
+            assert f.read() == "line 3...\n"
+        assert self.read() == "line 4...\n"